@@ -2,10 +2,25 @@
 # Converts raw questionnaire data into structured, interpreted results for LLM processing
 
 import json
+import logging
+import os
 import re
+import sys
+import traceback
+from array import array
+from bisect import bisect_left
 from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional
-import math
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Dict, List, Any, Callable, Iterator, Mapping, Optional, Pattern, Sequence, Tuple
+
+# Debug logging is opt-in (N8N_PP_DEBUG=1) so the n8n happy path does no formatting or I/O
+DEBUG = os.environ.get('N8N_PP_DEBUG') == '1'
+
+logger = logging.getLogger('n8n_questionnaire_preprocessor')
+if DEBUG and not logger.handlers:
+    logger.setLevel(logging.DEBUG)
+    logger.addHandler(logging.StreamHandler())
 
 # Clinical cut-offs and scoring information from reference table
 QUESTIONNAIRE_CUTOFFS = {
@@ -70,15 +85,25 @@ QUESTIONNAIRE_CUTOFFS = {
     }
 }
 
+# Bare YYYY-MM-DD strings that are valid in every month; days 29-31, years
+# before 1000 (which strftime does not zero-pad) and anything with a time
+# part still go through datetime for validation
+ISO_DATE_RE = re.compile(r'[1-9][0-9]{3}-(?:0[1-9]|1[0-2])-(?:0[1-9]|1[0-9]|2[0-8])')
+
 def to_iso_date(value: Any) -> str:
     """Convert various date formats to ISO date string"""
     if not value:
         return ''
+    if isinstance(value, str):
+        if ISO_DATE_RE.fullmatch(value):
+            return value
+        # Handle other ISO-8601 dates and datetimes ('Z' suffix as UTC)
+        try:
+            return datetime.fromisoformat(value.replace('Z', '+00:00')).strftime('%Y-%m-%d')
+        except ValueError:
+            return ''
     try:
-        if isinstance(value, str):
-            # Handle various date formats
-            dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
-        elif hasattr(value, 'year'):
+        if hasattr(value, 'year'):
             # Handle datetime/Timestamp objects (pandas Timestamp, datetime.datetime)
             dt = value
         elif isinstance(value, (int, float)):
@@ -95,6 +120,9 @@ def to_iso_date(value: Any) -> str:
 
 def safe_number(value: Any) -> float:
     """Safely convert value to number"""
+    # JSON answers usually arrive as floats already; return those untouched
+    if type(value) is float:
+        return value
     try:
         return float(value) if value is not None else 0.0
     except:
@@ -104,44 +132,59 @@ def safe_round(value: Any) -> int:
     """Safely round value to integer"""
     return round(safe_number(value))
 
-def get_questionnaire_info(questionnaire: str) -> Dict[str, Any]:
-    """Get cut-off and scoring information for a questionnaire"""
+def convert_cached(value: Any, convert: Callable[[Any], Any], cache: Dict[Any, Any]) -> Any:
+    """Convert a column value, reusing the result for values already seen in this batch"""
+    try:
+        return cache[value]
+    except KeyError:
+        converted = cache[value] = convert(value)
+        return converted
+    except TypeError:
+        # Unhashable value - convert without caching
+        return convert(value)
+
+# Read-only (key, info) pairs in QUESTIONNAIRE_CUTOFFS order
+QUESTIONNAIRE_CUTOFF_ITEMS = tuple((key, MappingProxyType(info)) for key, info in QUESTIONNAIRE_CUTOFFS.items())
+
+# One capture group per cut-off key, inside a lookahead so overlapping keys are all seen
+QUESTIONNAIRE_CUTOFF_RE = re.compile(
+    '(?=' + '|'.join(f'({re.escape(key)})' for key, _ in QUESTIONNAIRE_CUTOFF_ITEMS) + ')'
+)
+EMPTY_QUESTIONNAIRE_INFO = MappingProxyType({})
+UNKNOWN_QUESTIONNAIRE_INFO = MappingProxyType({"scale_range": "unknown", "direction": "unknown", "cutoffs": {}})
+
+@lru_cache(maxsize=128)
+def get_questionnaire_info(questionnaire: str) -> Mapping[str, Any]:
+    """Get cut-off and scoring information for a questionnaire (shared, read-only)"""
     if not questionnaire:
-        return {}
+        return EMPTY_QUESTIONNAIRE_INFO
     
     q_name = questionnaire.lower().strip()
     
-    # Find matching questionnaire in our cut-offs
-    for key, info in QUESTIONNAIRE_CUTOFFS.items():
-        if key in q_name:
-            return info.copy()
+    # Find matching questionnaire in our cut-offs; the earliest key in table order wins
+    group_index = min((match.lastindex for match in QUESTIONNAIRE_CUTOFF_RE.finditer(q_name)), default=None)
+    if group_index:
+        return QUESTIONNAIRE_CUTOFF_ITEMS[group_index - 1][1]
     
-    return {"scale_range": "unknown", "direction": "unknown", "cutoffs": {}}
+    return UNKNOWN_QUESTIONNAIRE_INFO
+
+# Severity bands from reference table as (inclusive upper bounds, labels);
+# a score maps to the first band whose upper bound it does not exceed
+PHQ9_SEVERITY_BANDS = ((4, 9, 14, 19), ('minimal', 'mild', 'moderate', 'moderately severe', 'severe'))
+GAD7_SEVERITY_BANDS = ((4, 9, 14), ('minimal', 'mild', 'moderate', 'severe'))
+PROMIS_SEVERITY_BANDS = ((55, 60, 70), ('within normal limits', 'mild', 'moderate', 'severe'))
+RSES_BANDS = ('low', 'normal', 'high')
 
 # Severity functions based on reference table
 def phq9_severity(score: int) -> str:
     """PHQ-9 severity: 5=mild, 10=moderate, 15=moderately severe, ≥20=severe"""
-    if score <= 4:
-        return 'minimal'
-    elif score <= 9:
-        return 'mild'
-    elif score <= 14:
-        return 'moderate'
-    elif score <= 19:
-        return 'moderately severe'
-    else:
-        return 'severe'
+    bounds, labels = PHQ9_SEVERITY_BANDS
+    return labels[bisect_left(bounds, score)]
 
 def gad7_severity(score: int) -> str:
     """GAD-7 severity: 5=mild, 10=moderate, 15=severe"""
-    if score <= 4:
-        return 'minimal'
-    elif score <= 9:
-        return 'mild'
-    elif score <= 14:
-        return 'moderate'
-    else:
-        return 'severe'
+    bounds, labels = GAD7_SEVERITY_BANDS
+    return labels[bisect_left(bounds, score)]
 
 def who5_index(raw_score: int) -> int:
     """WHO-5: raw 0-25 multiplied by 4 = index 0-100"""
@@ -149,24 +192,171 @@ def who5_index(raw_score: int) -> int:
 
 def promis_severity(t_score: float) -> str:
     """PROMIS Pediatric T-score interpretation"""
-    if t_score <= 55:
-        return 'within normal limits'
-    elif t_score <= 60:
-        return 'mild'
-    elif t_score <= 70:
-        return 'moderate'
-    else:
-        return 'severe'
+    bounds, labels = PROMIS_SEVERITY_BANDS
+    return labels[bisect_left(bounds, t_score)]
 
 def rses_band(score: int) -> str:
-    """Rosenberg Self-Esteem Scale bands"""
-    if score < 15:
-        return 'low'
-    elif score > 25:
-        return 'high'
-    else:
-        return 'normal'
+    """Rosenberg Self-Esteem Scale bands: <15 low, >25 high"""
+    return RSES_BANDS[(score >= 15) + (score > 25)]
+
+# PROMIS raw-score to T-score conversion tables (Pediatric and Parent Proxy)
+PROMIS_DEPRESSION_PEDIATRIC = MappingProxyType({
+    8: 39.9, 9: 46.9, 10: 49.3, 11: 51.0, 12: 52.4, 13: 53.6, 14: 54.6, 15: 55.6,
+    16: 56.5, 17: 57.4, 18: 58.3, 19: 59.1, 20: 60.0, 21: 60.8, 22: 61.7, 23: 62.5,
+    24: 63.3, 25: 64.1, 26: 64.9, 27: 65.7, 28: 66.5, 29: 67.3, 30: 68.0, 31: 68.8,
+    32: 69.6, 33: 70.4, 34: 71.2, 35: 72.1, 36: 73.1, 37: 74.2, 38: 75.5, 39: 77.2, 40: 80.3
+})
+
+PROMIS_ANXIETY_PEDIATRIC = MappingProxyType({
+    8: 39.0, 9: 45.4, 10: 47.8, 11: 49.6, 12: 51.0, 13: 52.2, 14: 53.3, 15: 54.4,
+    16: 55.3, 17: 56.3, 18: 57.2, 19: 58.1, 20: 59.0, 21: 59.9, 22: 60.8, 23: 61.7,
+    24: 62.6, 25: 63.4, 26: 64.3, 27: 65.1, 28: 65.9, 29: 66.8, 30: 67.6, 31: 68.4,
+    32: 69.2, 33: 70.0, 34: 70.9, 35: 71.8, 36: 72.8, 37: 73.9, 38: 75.2, 39: 76.7, 40: 79.8
+})
+
+PROMIS_LIFE_SATISFACTION_PEDIATRIC = MappingProxyType({
+    8: 20.5, 9: 23.6, 10: 25.3, 11: 26.7, 12: 27.9, 13: 28.9, 14: 29.9, 15: 30.7,
+    16: 31.6, 17: 32.5, 18: 33.3, 19: 34.1, 20: 34.9, 21: 35.8, 22: 36.6, 23: 37.4,
+    24: 38.3, 25: 39.1, 26: 40.0, 27: 40.9, 28: 41.9, 29: 42.9, 30: 43.9, 31: 44.9,
+    32: 45.9, 33: 46.9, 34: 48.1, 35: 49.2, 36: 50.5, 37: 52.0, 38: 53.9, 39: 56.7, 40: 62.5
+})
+
+PROMIS_DEPRESSION_PARENT = MappingProxyType({
+    6: 40.8, 7: 48.2, 8: 51.1, 9: 53.2, 10: 54.9, 11: 56.4, 12: 57.9, 13: 59.2,
+    14: 60.6, 15: 61.9, 16: 63.2, 17: 64.6, 18: 65.9, 19: 67.1, 20: 68.3, 21: 69.6,
+    22: 70.7, 23: 71.9, 24: 73.0, 25: 74.2, 26: 75.4, 27: 76.7, 28: 78.2, 29: 79.8, 30: 82.7
+})
+
+PROMIS_ANXIETY_PARENT = MappingProxyType({
+    8: 38.8, 9: 45.2, 10: 48.0, 11: 49.9, 12: 51.5, 13: 52.8, 14: 54.0, 15: 55.2,
+    16: 56.3, 17: 57.3, 18: 58.4, 19: 59.4, 20: 60.4, 21: 61.4, 22: 62.5, 23: 63.4,
+    24: 64.4, 25: 65.3, 26: 66.3, 27: 67.2, 28: 68.1, 29: 69.0, 30: 69.9, 31: 70.8,
+    32: 71.7, 33: 72.6, 34: 73.5, 35: 74.5, 36: 75.6, 37: 76.8, 38: 78.2, 39: 80.0, 40: 82.7
+})
+
+PROMIS_LIFE_SATISFACTION_PARENT = MappingProxyType({
+    8: 18.5, 9: 21.4, 10: 22.9, 11: 24.1, 12: 25.2, 13: 26.1, 14: 27.0, 15: 27.8,
+    16: 28.6, 17: 29.4, 18: 30.2, 19: 31.0, 20: 31.8, 21: 32.7, 22: 33.5, 23: 34.4,
+    24: 35.3, 25: 36.2, 26: 37.2, 27: 38.2, 28: 39.2, 29: 40.3, 30: 41.5, 31: 42.7,
+    32: 43.9, 33: 45.1, 34: 46.4, 35: 47.7, 36: 49.1, 37: 50.6, 38: 52.5, 39: 55.2, 40: 61.5
+})
+
+def get_promis_t_score(raw_total: int, conversion_table: Mapping[int, float]) -> Optional[float]:
+    """Convert raw PROMIS score to T-score using lookup table"""
+    return conversion_table.get(raw_total, None)
+
+def interpret_promis_t_score(t_score: float, measure_type: str) -> Dict[str, str]:
+    """Interpret PROMIS T-score based on measure type"""
+    if measure_type in ['depression', 'anxiety']:
+        # Higher scores = worse (negative measures)
+        if t_score <= 50:
+            return {
+                'severity': 'within normal limits',
+                'interpretation': 'Within Normal Limits'
+            }
+        elif t_score <= 55:
+            return {
+                'severity': 'mild',
+                'interpretation': 'Mild'
+            }
+        elif t_score <= 65:
+            return {
+                'severity': 'moderate',
+                'interpretation': 'Moderate'
+            }
+        else:
+            return {
+                'severity': 'severe',
+                'interpretation': 'Severe'
+            }
+    else:  # life satisfaction
+        # Higher scores = better (positive measure)
+        if t_score >= 70:
+            return {
+                'severity': 'very high',
+                'interpretation': 'Very High'
+            }
+        elif t_score >= 60:
+            return {
+                'severity': 'high',
+                'interpretation': 'High'
+            }
+        elif t_score >= 40:
+            return {
+                'severity': 'average',
+                'interpretation': 'Average'
+            }
+        elif t_score >= 30:
+            return {
+                'severity': 'low',
+                'interpretation': 'Low'
+            }
+        else:
+            return {
+                'severity': 'very low',
+                'interpretation': 'Very Low'
+            }
+
+# PedsQL raw item score (0-4) to reverse-transformed 0-100 scale
+PEDSQL_SCORE_TRANSFORM = MappingProxyType({0: 100, 1: 75, 2: 50, 3: 25, 4: 0})
+
+# PedsQL expected items per dimension, in dimension id order
+PEDSQL_DIMENSION_ITEMS = MappingProxyType({
+    'Physical': 8,      # Physical Functioning (8 items)
+    'Emotional': 5,     # Emotional Functioning (5 items) 
+    'Social': 5,        # Social Functioning (5 items)
+    'School': 5         # School Functioning (5 items)
+})
 
+# PedsQL dimension id by question number (index 0 unused)
+# Questions 1-8: Physical, 9-13: Emotional, 14-18: Social, 19-23: School
+PEDSQL_QUESTION_DIMENSIONS = (None,) + (0,) * 8 + (1,) * 5 + (2,) * 5 + (3,) * 5
+
+# PedsQL Psychosocial/Total Score interpretation bands from reference table, highest first
+PEDSQL_INTERPRETATION_BANDS = (
+    (80, MappingProxyType({
+        'severity': 'typical range',
+        'interpretation': 'Typical range',
+        'mental_health_status': 'Normal wellbeing'
+    })),
+    (70, MappingProxyType({
+        'severity': 'slightly below norms',
+        'interpretation': 'Slightly below norms', 
+        'mental_health_status': 'Mild emotional or adjustment difficulties'
+    })),
+    (60, MappingProxyType({
+        'severity': 'noticeably below average',
+        'interpretation': 'Noticeably below average',
+        'mental_health_status': 'Possible clinical concern — monitor or screen further'
+    }))
+)
+PEDSQL_INTERPRETATION_IMPAIRED = MappingProxyType({
+    'severity': 'significantly impaired',
+    'interpretation': 'Significantly impaired',
+    'mental_health_status': 'Likely emotional/mental-health problems'
+})
+
+QUESTION_NUMBER_RE = re.compile(r'^(\d+)')
+
+def transform_pedsql_score(raw_score: Any) -> Optional[int]:
+    """Transform raw PedsQL score (0-4) to 0-100 scale"""
+    return PEDSQL_SCORE_TRANSFORM.get(int(raw_score), None)
+
+def get_question_number(question_text: Any) -> Optional[int]:
+    """Extract question number from question text (e.g., '1. Question text' -> 1)"""
+    match = QUESTION_NUMBER_RE.match(str(question_text).strip())
+    if match:
+        return int(match.group(1))
+    return None
+
+def get_pedsql_interpretation(score: float) -> Mapping[str, str]:
+    """Get PedsQL interpretation based on reference table for Psychosocial/Total Score"""
+    for threshold, interpretation in PEDSQL_INTERPRETATION_BANDS:
+        if score >= threshold:
+            return interpretation
+    return PEDSQL_INTERPRETATION_IMPAIRED  # < 60
+
+@lru_cache(maxsize=128)
 def detect_sdq_version(questionnaire_name: str) -> str:
     """Detect if SDQ is parent or self-completed version"""
     name_lower = questionnaire_name.lower()
@@ -178,87 +368,94 @@ def detect_sdq_version(questionnaire_name: str) -> str:
         # Default to self-completed for youth report (11-17)
         return 'self_completed'
 
-def get_sdq_cutoffs(version: str) -> Dict[str, Dict[str, Any]]:
+# SDQ band ranges (inclusive) per subscale, by version
+SDQ_CUTOFFS_SELF_COMPLETED = MappingProxyType({
+    'total_difficulties': MappingProxyType({
+        'normal': (0, 15),
+        'borderline': (16, 19),
+        'abnormal': (20, 40)
+    }),
+    'emotional': MappingProxyType({
+        'normal': (0, 5),
+        'borderline': (6, 6),
+        'abnormal': (7, 10)
+    }),
+    'conduct': MappingProxyType({
+        'normal': (0, 3),
+        'borderline': (4, 4),
+        'abnormal': (5, 10)
+    }),
+    'hyperactivity': MappingProxyType({
+        'normal': (0, 5),
+        'borderline': (6, 6),
+        'abnormal': (7, 10)
+    }),
+    'peer_problems': MappingProxyType({
+        'normal': (0, 3),
+        'borderline': (4, 5),
+        'abnormal': (6, 10)
+    }),
+    'prosocial': MappingProxyType({
+        'normal': (6, 10),
+        'borderline': (5, 5),
+        'abnormal': (0, 4)
+    })
+})
+
+SDQ_CUTOFFS_PARENT = MappingProxyType({
+    'total_difficulties': MappingProxyType({
+        'normal': (0, 13),
+        'borderline': (14, 16),
+        'abnormal': (17, 40)
+    }),
+    'emotional': MappingProxyType({
+        'normal': (0, 3),
+        'borderline': (4, 4),
+        'abnormal': (5, 10)
+    }),
+    'conduct': MappingProxyType({
+        'normal': (0, 2),
+        'borderline': (3, 3),
+        'abnormal': (4, 10)
+    }),
+    'hyperactivity': MappingProxyType({
+        'normal': (0, 5),
+        'borderline': (6, 6),
+        'abnormal': (7, 10)
+    }),
+    'peer_problems': MappingProxyType({
+        'normal': (0, 2),
+        'borderline': (3, 3),
+        'abnormal': (4, 10)
+    }),
+    'prosocial': MappingProxyType({
+        'normal': (6, 10),
+        'borderline': (5, 5),
+        'abnormal': (0, 4)
+    })
+})
+
+def get_sdq_cutoffs(version: str) -> Mapping[str, Mapping[str, tuple]]:
     """Get SDQ cut-offs based on version (parent or self-completed)"""
     if version == 'self_completed':
-        return {
-            'total_difficulties': {
-                'normal': (0, 15),
-                'borderline': (16, 19),
-                'abnormal': (20, 40)
-            },
-            'emotional': {
-                'normal': (0, 5),
-                'borderline': (6, 6),
-                'abnormal': (7, 10)
-            },
-            'conduct': {
-                'normal': (0, 3),
-                'borderline': (4, 4),
-                'abnormal': (5, 10)
-            },
-            'hyperactivity': {
-                'normal': (0, 5),
-                'borderline': (6, 6),
-                'abnormal': (7, 10)
-            },
-            'peer_problems': {
-                'normal': (0, 3),
-                'borderline': (4, 5),
-                'abnormal': (6, 10)
-            },
-            'prosocial': {
-                'normal': (6, 10),
-                'borderline': (5, 5),
-                'abnormal': (0, 4)
-            }
-        }
+        return SDQ_CUTOFFS_SELF_COMPLETED
     else:  # parent version
-        return {
-            'total_difficulties': {
-                'normal': (0, 13),
-                'borderline': (14, 16),
-                'abnormal': (17, 40)
-            },
-            'emotional': {
-                'normal': (0, 3),
-                'borderline': (4, 4),
-                'abnormal': (5, 10)
-            },
-            'conduct': {
-                'normal': (0, 2),
-                'borderline': (3, 3),
-                'abnormal': (4, 10)
-            },
-            'hyperactivity': {
-                'normal': (0, 5),
-                'borderline': (6, 6),
-                'abnormal': (7, 10)
-            },
-            'peer_problems': {
-                'normal': (0, 2),
-                'borderline': (3, 3),
-                'abnormal': (4, 10)
-            },
-            'prosocial': {
-                'normal': (6, 10),
-                'borderline': (5, 5),
-                'abnormal': (0, 4)
-            }
-        }
+        return SDQ_CUTOFFS_PARENT
 
-def interpret_sdq_score(score: int, subscale: str, cutoffs: Dict[str, tuple]) -> Dict[str, Any]:
+def interpret_sdq_score(score: int, subscale: str, cutoffs: Mapping[str, Mapping[str, tuple]]) -> Dict[str, Any]:
     """Interpret a single SDQ score against cut-offs"""
-    if subscale not in cutoffs:
+    ranges = cutoffs.get(subscale)
+    if ranges is None:
         return {'band': 'unknown', 'interpretation': 'No cut-offs available'}
     
-    ranges = cutoffs[subscale]
+    normal_min, normal_max = ranges['normal']
+    borderline_min, borderline_max = ranges['borderline']
     
     # Check which band the score falls into
-    if ranges['normal'][0] <= score <= ranges['normal'][1]:
+    if normal_min <= score <= normal_max:
         band = 'normal'
         interpretation = 'close to average - clinically significant problems in this area are unlikely'
-    elif ranges['borderline'][0] <= score <= ranges['borderline'][1]:
+    elif borderline_min <= score <= borderline_max:
         band = 'borderline'
         if subscale == 'prosocial':
             interpretation = 'slightly low, which may reflect clinically significant problems'
@@ -287,672 +484,732 @@ def includes_any(text: str, keywords: List[str]) -> bool:
     norm_text = normalize_text(text)
     return any(normalize_text(keyword) in norm_text for keyword in keywords)
 
-def score_subscales(responses: List[Dict], mapping: Dict[str, callable]) -> Dict[str, Dict[str, int]]:
-    """Score subscales based on dimension mapping"""
-    subscales = {}
-    for name, predicate in mapping.items():
-        matching_responses = [r for r in responses if predicate(r)]
-        total = sum(safe_number(r.get('answer', 0)) for r in matching_responses)
-        subscales[name] = {
-            'total': int(total),
-            'count': len(matching_responses)
-        }
-    return subscales
+# Subscale dimension keywords as (subscale name, keywords), matched case-insensitively against the dimension
+SubscaleKeywords = Tuple[Tuple[str, Tuple[str, ...]], ...]
 
-def preprocess_questionnaire_data(items: List[Dict]) -> List[Dict]:
-    """
-    Main preprocessing function for questionnaire data
+SCARED_SUBSCALE_KEYWORDS = (
+    ('Panic', ('panic',)),
+    ('Generalized Anxiety (GAD)', ('gad', 'generalized')),
+    ('Separation', ('separation',)),
+    ('Social', ('social',)),
+    ('School Phobia', ('school',))
+)
+
+SDQ_SUBSCALE_KEYWORDS = (
+    ('Emotional', ('emotional',)),
+    ('Conduct', ('conduct',)),
+    ('Hyperactivity/Inattention', ('hyperactivity', 'inattention')),
+    ('Peer Problems', ('peer',)),
+    ('Prosocial', ('prosocial',))
+)
+
+PSC17_SUBSCALE_KEYWORDS = (
+    ('Internalizing', ('internalizing',)),
+    ('Attention', ('attention',)),
+    ('Externalizing', ('externalizing',))
+)
+
+SubscaleMatchers = Tuple[Tuple[str, Pattern], ...]
+
+def compile_subscale_matchers(subscale_keywords: SubscaleKeywords) -> SubscaleMatchers:
+    """Compile each subscale's keywords into one case-insensitive alternation regex"""
+    return tuple(
+        (name, re.compile('|'.join(map(re.escape, keywords)), re.IGNORECASE))
+        for name, keywords in subscale_keywords
+    )
+
+SCARED_SUBSCALE_MATCHERS = compile_subscale_matchers(SCARED_SUBSCALE_KEYWORDS)
+SDQ_SUBSCALE_MATCHERS = compile_subscale_matchers(SDQ_SUBSCALE_KEYWORDS)
+PSC17_SUBSCALE_MATCHERS = compile_subscale_matchers(PSC17_SUBSCALE_KEYWORDS)
+
+def score_subscales(responses: List[Dict], answers: Sequence[float],
+                    subscale_matchers: SubscaleMatchers) -> Dict[str, Dict[str, int]]:
+    """Score subscales in one pass, bucketing each answer by its response's dimension matchers"""
+    totals = [0.0] * len(subscale_matchers)
+    counts = [0] * len(subscale_matchers)
+    # Dimension text -> subscale indices it belongs to; a form has only a few distinct
+    # dimensions, so keyword matching runs once per dimension rather than per response
+    dimension_codes = {}
+    for response, answer in zip(responses, answers):
+        dimension = response['dimension']
+        codes = dimension_codes.get(dimension)
+        if codes is None:
+            codes = dimension_codes[dimension] = tuple(
+                index for index, (_, matcher) in enumerate(subscale_matchers)
+                if matcher.search(dimension)
+            )
+        if codes:
+            for index in codes:
+                totals[index] += answer
+                counts[index] += 1
+    return {
+        name: {'total': int(totals[index]), 'count': counts[index]}
+        for index, (name, _) in enumerate(subscale_matchers)
+    }
+
+# Subscale flag rules as (subscale name, threshold, flag text), in reporting order
+SCARED_SUBSCALE_FLAGS = (
+    ('Panic', 7, 'SCARED Panic ≥7'),
+    ('Social', 8, 'SCARED Social ≥8'),
+    ('School Phobia', 3, 'SCARED School ≥3'),
+    ('Separation', 5, 'SCARED Separation ≥5'),
+    ('Generalized Anxiety (GAD)', 9, 'SCARED GAD ≥9')
+)
+
+PSC17_SUBSCALE_FLAGS = (
+    ('Internalizing', 5, 'PSC-17 Internalizing ≥5'),
+    ('Attention', 7, 'PSC-17 Attention ≥7'),
+    ('Externalizing', 7, 'PSC-17 Externalizing ≥7')
+)
+
+def subscale_flags(subscales: Dict[str, Dict[str, int]], rules: tuple) -> List[str]:
+    """Return the flag text of every subscale rule whose total meets its threshold"""
+    flags = []
+    for subscale_name, threshold, flag in rules:
+        subscale = subscales.get(subscale_name)
+        if subscale and subscale['total'] >= threshold:
+            flags.append(flag)
+    return flags
+
+# Ordinal flag tiers as (cut-off key, default threshold, flag template), most severe first
+PHQ9_FLAG_TIERS = (
+    ('severe', 20, 'PHQ-9 ≥{} (severe depression)'),
+    ('moderately_severe', 15, 'PHQ-9 ≥{} (moderately severe)'),
+    ('moderate', 10, 'PHQ-9 ≥{} (moderate depression)'),
+    ('mild', 5, 'PHQ-9 ≥{} (mild depression)')
+)
+
+GAD7_FLAG_TIERS = (
+    ('severe', 15, 'GAD-7 ≥{} (severe anxiety)'),
+    ('moderate', 10, 'GAD-7 ≥{} (moderate anxiety)'),
+    ('mild', 5, 'GAD-7 ≥{} (mild anxiety)')
+)
+
+# WHO-5 is lower-worse, so its tiers match at or below the threshold
+WHO5_FLAG_TIERS = (
+    ('depression_risk', 28, 'WHO-5 ≤{} indicates depression risk'),
+    ('poor_wellbeing', 50, 'WHO-5 ≤{} suggests poor well-being')
+)
+
+@lru_cache(maxsize=128, typed=True)
+def format_tier_flag(template: str, threshold: Any) -> str:
+    """Format a tier flag; cut-offs are static, so each text is built once"""
+    return template.format(threshold)
+
+def tier_flag(score: float, cutoffs: Mapping[str, Any], tiers: tuple,
+              lower_worse: bool = False) -> Optional[str]:
+    """Return the flag text of the most severe tier the score reaches, or None"""
+    for key, default, template in tiers:
+        threshold = cutoffs.get(key, default)
+        if (score <= threshold) if lower_worse else (score >= threshold):
+            return format_tier_flag(template, threshold)
+    return None
+
+# Static scale/note text per questionnaire tag, copied into result['derived'] first
+DERIVED_TEMPLATES = MappingProxyType({
+    'phq9': MappingProxyType({'scale': 'PHQ-9 (0-27, higher worse)'}),
+    'who5': MappingProxyType({'scale': 'WHO-5 (0-100 index, lower worse)'}),
+    'gad7': MappingProxyType({'scale': 'GAD-7 (0-21, higher worse)'}),
+    'pedsql': MappingProxyType({
+        'scale': 'PedsQL Psychosocial/Total Score (0-100, higher better)',
+        'note': 'Scores reverse-transformed: 0→100, 1→75, 2→50, 3→25, 4→0. Interpretation based on Psychosocial/Total Score ratio'
+    }),
+    'cesdc': MappingProxyType({'scale': 'CES-DC (≥15 suggests risk for depression)'}),
+    'scared': MappingProxyType({'scale': 'SCARED (total ≥25 possible anxiety disorder; subscale cut-offs apply)'}),
+    'rses': MappingProxyType({
+        'scale': 'RSES (0-30; <15 low, 15-25 normal, >25 high)',
+        'note': 'Contains reverse-scored items; verify scoring before interpretation'
+    }),
+    'psc17': MappingProxyType({'scale': 'PSC-17 (total ≥15 positive; subscales Internalizing ≥5, Attention ≥7, Externalizing ≥7)'})
+})
+
+# PROMIS scale/note text keyed by (measure type, is parent proxy); None is an unknown measure
+PROMIS_DERIVED_TEMPLATES = MappingProxyType({
+    **{
+        (measure_type, is_parent): MappingProxyType({
+            'scale': f'PROMIS {label} {"Parent Proxy" if is_parent else "Pediatric"} T-score (mean 50, SD 10, {direction})',
+            'note': note
+        })
+        for measure_type, label, direction, note in (
+            ('depression', 'Depression', 'higher worse', 'Higher T-scores indicate more depression symptoms'),
+            ('anxiety', 'Anxiety', 'higher worse', 'Higher T-scores indicate more anxiety symptoms'),
+            ('life_satisfaction', 'Life Satisfaction', 'higher better', 'Higher T-scores indicate better life satisfaction')
+        )
+        for is_parent in (False, True)
+    },
+    **{
+        (None, is_parent): MappingProxyType({
+            'scale': 'PROMIS Pediatric T-score (mean 50, SD 10)',
+            'note': 'Unknown PROMIS measure - cannot convert to T-score'
+        })
+        for is_parent in (False, True)
+    }
+})
+
+def round_pedsql_dimension_scores(dimension_scores: Dict[str, Dict[str, Any]]) -> None:
+    """Round PedsQL dimension scores in place for output (scores 2dp, completion 1dp)"""
+    for dimension_data in dimension_scores.values():
+        if dimension_data['score'] is not None:
+            dimension_data['score'] = round(dimension_data['score'], 2)
+        dimension_data['completion_rate'] = round(dimension_data['completion_rate'], 1)
+
+def handle_phq9(result: Dict[str, Any], group: Dict[str, Any], q_info: Mapping[str, Any],
+                total: float, name: str) -> None:
+    """PHQ-9"""
+    cutoffs = q_info.get('cutoffs', {})
+    result['severity'] = phq9_severity(int(total))
+    result['derived'].update(DERIVED_TEMPLATES['phq9'])
+    result['derived']['severity_level'] = result['severity']
+    result['derived']['total_score'] = int(total)
     
-    Args:
-        items: List of raw questionnaire items from n8n
+    # Apply clinical cut-offs
+    flag = tier_flag(total, cutoffs, PHQ9_FLAG_TIERS)
+    if flag:
+        result['clinical_flags'].append(flag)
         
-    Returns:
-        List of processed items with computed scores, severities, and flags
-    """
-    
-    # Start preprocessing (quiet mode for n8n Code node)
+    # Clinical significance flag
+    clinical_flag = q_info.get('clinical_flag', {})
+    flag_threshold = clinical_flag.get('threshold', 10)
+    if total >= flag_threshold:
+        result['clinical_flags'].append(f'PHQ-9 ≥{flag_threshold} suggests {clinical_flag.get("meaning", "clinical attention")}')
+
+def handle_who5(result: Dict[str, Any], group: Dict[str, Any], q_info: Mapping[str, Any],
+                total: float, name: str) -> None:
+    """WHO-5"""
+    cutoffs = q_info.get('cutoffs', {})
+    index = who5_index(int(total))
+    result['who5_index'] = index
+    result['derived'].update(DERIVED_TEMPLATES['who5'])
+    result['derived']['raw_score'] = int(total)
+    result['derived']['total_score'] = int(total)  # Add total_score for consistency
+    result['derived']['index_score'] = index
+    poor_wellbeing = cutoffs.get('poor_wellbeing', 50)
+    result['severity'] = 'reduced well-being' if index <= poor_wellbeing else 'adequate well-being'
+    result['derived']['severity_level'] = result['severity']
     
-    # Step A: Normalize individual rows
-    rows = []
-    questionnaire_counts = {}
+    # Apply WHO-5 cut-offs
+    flag = tier_flag(index, cutoffs, WHO5_FLAG_TIERS, lower_worse=True)
+    if flag:
+        result['clinical_flags'].append(flag)
+
+def handle_gad7(result: Dict[str, Any], group: Dict[str, Any], q_info: Mapping[str, Any],
+                total: float, name: str) -> None:
+    """GAD-7"""
+    cutoffs = q_info.get('cutoffs', {})
+    result['severity'] = gad7_severity(int(total))
+    result['derived'].update(DERIVED_TEMPLATES['gad7'])
+    result['derived']['severity_level'] = result['severity']
+    result['derived']['total_score'] = int(total)
     
-    for item in items:
-        json_data = item.get('json', {})
-        questionnaire = str(json_data.get('questionnaire', '')).strip()
-        
-        # Count questionnaires for debugging
-        questionnaire_counts[questionnaire] = questionnaire_counts.get(questionnaire, 0) + 1
-        
-        # Skip rows with NaN/None/empty questionnaire (metadata rows)
-        if not questionnaire or questionnaire.lower() in ['nan', 'none', '<na>', 'null']:
-            continue
-        
-        # Try both 'timepoint' (singular) and 'timepoints' (plural) for flexibility
-        timepoint_value = json_data.get('timepoint', json_data.get('timepoints', 0))
-        date_str = to_iso_date(json_data.get('date'))
-        dim_str = str(json_data.get('dimension', '')).strip()
+    # Apply GAD-7 cut-offs
+    flag = tier_flag(total, cutoffs, GAD7_FLAG_TIERS)
+    if flag:
+        result['clinical_flags'].append(flag)
 
-        # Note: We no longer skip rows that are missing timepoint/date/dimension; they will be included as-is
-            
-        row = {
-            'questionnaire': questionnaire,
-            'timepoint': safe_round(timepoint_value),
-            'date': date_str,
-            'question': str(json_data.get('question', '')).strip(),
-            'answer_int': safe_number(json_data.get('answer', 0)),
-            'answer_raw': safe_number(json_data.get('answer', 0)),
-            'dimension': dim_str,
-            'free_text': str(json_data.get('free_text', '')).strip() if json_data.get('free_text') and not (isinstance(json_data.get('free_text'), float) and math.isnan(json_data.get('free_text'))) else '',
-            'response_options': str(json_data.get('response_options', '')).strip()
-        }
-        rows.append(row)
+def handle_promis(result: Dict[str, Any], group: Dict[str, Any], q_info: Mapping[str, Any],
+                  total: float, name: str) -> None:
+    """PROMIS (Depression, Anxiety, Life Satisfaction)"""
+    # Determine measure type and version
+    is_parent = 'parent' in name
+    measure_type = None
+    conversion_table = None
     
-    # Questionnaire counts collected (not printed in n8n)
+    if 'depression' in name:
+        measure_type = 'depression'
+        conversion_table = PROMIS_DEPRESSION_PARENT if is_parent else PROMIS_DEPRESSION_PEDIATRIC
+    elif 'anxiety' in name:
+        measure_type = 'anxiety'
+        conversion_table = PROMIS_ANXIETY_PARENT if is_parent else PROMIS_ANXIETY_PEDIATRIC
+    elif 'life' in name or 'satisfaction' in name:
+        measure_type = 'life_satisfaction'
+        conversion_table = PROMIS_LIFE_SATISFACTION_PARENT if is_parent else PROMIS_LIFE_SATISFACTION_PEDIATRIC
     
-    # Step B: Group by questionnaire + timepoint
-    groups = {}
-    for row in rows:
-        key = f"{row['questionnaire']}::{row['timepoint']}"
-        if key not in groups:
-            groups[key] = {
-                'questionnaire': row['questionnaire'],
-                'timepoint': row['timepoint'],
-                'date': row['date'],
-                'responses': [],
-                'free_text': row['free_text']
-            }
-        
-        # Accumulate free text if present in this row
-        if row['free_text'] and row['free_text'] not in groups[key]['free_text']:
-            if groups[key]['free_text']:
-                groups[key]['free_text'] += ' | ' + row['free_text']
-            else:
-                groups[key]['free_text'] = row['free_text']
-        
-        groups[key]['responses'].append({
-            'question': row['question'],
-            'answer': row['answer_int'],
-            'dimension': row['dimension'],
-            'response_options': row['response_options']
-        })
+    result['derived'].update(PROMIS_DERIVED_TEMPLATES[measure_type, is_parent])
     
-    # Groups created (quiet)
+    # Store raw scores
+    result['derived']['raw_score'] = int(total)
+    result['derived']['total_score'] = int(total)
     
-    # Step C: Process each questionnaire group with cut-off focus
-    results = []
-    for group in groups.values():
-        name = normalize_text(group['questionnaire'])
-        total = sum(safe_number(r.get('answer', 0)) for r in group['responses'])
-        
-        # Get questionnaire-specific cut-off information
-        q_info = get_questionnaire_info(group['questionnaire'])
+    # Convert to T-score if table available
+    if conversion_table and measure_type:
+        t_score = get_promis_t_score(int(total), conversion_table)
         
-        result = {
-            'questionnaire': group['questionnaire'],
-            'timepoint': group['timepoint'],
-            'date': group['date'],
-            'raw_total': int(total),
-            'scale_info': {
-                'range': q_info.get('scale_range', 'unknown'),
-                'direction': q_info.get('direction', 'unknown'),
-                'cutoffs': q_info.get('cutoffs', {})
-            },
-            'severity': '',
-            'clinical_flags': [],
-            'derived': {},  # Initialize derived dictionary
-            'responses': group['responses'],
-            'free_text': group['free_text']
-        }
-        
-        # PHQ-9
-        if 'phq-9' in name or 'phq9' in name or 'phq' in name:
-            cutoffs = q_info.get('cutoffs', {})
-            result['severity'] = phq9_severity(int(total))
-            result['derived']['scale'] = 'PHQ-9 (0-27, higher worse)'
-            result['derived']['severity_level'] = result['severity']
-            result['derived']['total_score'] = int(total)
+        if t_score is not None:
+            result['derived']['t_score'] = round(t_score, 1)
             
-            # Apply clinical cut-offs
-            if total >= cutoffs.get('severe', 20):
-                result['clinical_flags'].append(f'PHQ-9 ≥{cutoffs.get("severe", 20)} (severe depression)')
-            elif total >= cutoffs.get('moderately_severe', 15):
-                result['clinical_flags'].append(f'PHQ-9 ≥{cutoffs.get("moderately_severe", 15)} (moderately severe)')
-            elif total >= cutoffs.get('moderate', 10):
-                result['clinical_flags'].append(f'PHQ-9 ≥{cutoffs.get("moderate", 10)} (moderate depression)')
-            elif total >= cutoffs.get('mild', 5):
-                result['clinical_flags'].append(f'PHQ-9 ≥{cutoffs.get("mild", 5)} (mild depression)')
-                
-            # Clinical significance flag
-            clinical_flag = q_info.get('clinical_flag', {})
-            if total >= clinical_flag.get('threshold', 10):
-                result['clinical_flags'].append(f'PHQ-9 ≥{clinical_flag.get("threshold", 10)} suggests {clinical_flag.get("meaning", "clinical attention")}')
-        
-        # WHO-5
-        elif any(x in name for x in ['who-5', 'who5', 'who 5']):
-            cutoffs = q_info.get('cutoffs', {})
-            index = who5_index(int(total))
-            result['who5_index'] = index
-            result['derived']['scale'] = 'WHO-5 (0-100 index, lower worse)'
-            result['derived']['raw_score'] = int(total)
-            result['derived']['total_score'] = int(total)  # Add total_score for consistency
-            result['derived']['index_score'] = index
-            result['severity'] = 'reduced well-being' if index <= cutoffs.get('poor_wellbeing', 50) else 'adequate well-being'
+            # Get interpretation
+            interpretation = interpret_promis_t_score(t_score, measure_type)
+            result['severity'] = interpretation['severity']
             result['derived']['severity_level'] = result['severity']
+            result['derived']['interpretation'] = interpretation['interpretation']
             
-            # Apply WHO-5 cut-offs
-            if index <= cutoffs.get('depression_risk', 28):
-                result['clinical_flags'].append(f'WHO-5 ≤{cutoffs.get("depression_risk", 28)} indicates depression risk')
-            elif index <= cutoffs.get('poor_wellbeing', 50):
-                result['clinical_flags'].append(f'WHO-5 ≤{cutoffs.get("poor_wellbeing", 50)} suggests poor well-being')
+            # Add clinical flags based on T-score thresholds
+            if measure_type in ['depression', 'anxiety']:
+                if t_score > 65:
+                    result['clinical_flags'].append(f'PROMIS {measure_type.title()} T-score {t_score:.1f} (Severe - significant clinical concern)')
+                elif t_score > 55:
+                    result['clinical_flags'].append(f'PROMIS {measure_type.title()} T-score {t_score:.1f} (Moderate - clinical attention warranted)')
+                elif t_score > 50:
+                    result['clinical_flags'].append(f'PROMIS {measure_type.title()} T-score {t_score:.1f} (Mild - monitor)')
+            else:  # life satisfaction
+                if t_score < 30:
+                    result['clinical_flags'].append(f'PROMIS Life Satisfaction T-score {t_score:.1f} (Very Low - significant concern)')
+                elif t_score < 40:
+                    result['clinical_flags'].append(f'PROMIS Life Satisfaction T-score {t_score:.1f} (Low - below average)')
+            
+            result['clinical_flags'].append(f'PROMIS {measure_type.replace("_", " ").title()}: Raw={int(total)}, T-score={t_score:.1f} ({interpretation["interpretation"]})')
         
-        # GAD-7
-        elif any(x in name for x in ['gad-7', 'gad7', 'gad 7']):
-            cutoffs = q_info.get('cutoffs', {})
-            result['severity'] = gad7_severity(int(total))
-            result['derived']['scale'] = 'GAD-7 (0-21, higher worse)'
+        else:
+            # Raw score outside conversion table range
+            result['severity'] = 'raw score outside conversion range'
             result['derived']['severity_level'] = result['severity']
-            result['derived']['total_score'] = int(total)
-            
-            # Apply GAD-7 cut-offs
-            if total >= cutoffs.get('severe', 15):
-                result['clinical_flags'].append(f'GAD-7 ≥{cutoffs.get("severe", 15)} (severe anxiety)')
-            elif total >= cutoffs.get('moderate', 10):
-                result['clinical_flags'].append(f'GAD-7 ≥{cutoffs.get("moderate", 10)} (moderate anxiety)')
-            elif total >= cutoffs.get('mild', 5):
-                result['clinical_flags'].append(f'GAD-7 ≥{cutoffs.get("mild", 5)} (mild anxiety)')
+            result['clinical_flags'].append(f'PROMIS raw total {int(total)} outside conversion table range (8-40)')
+    
+    else:
+        # No conversion table available
+        result['severity'] = 'unknown PROMIS measure'
+        result['derived']['severity_level'] = result['severity']
+        result['clinical_flags'].append(f'PROMIS raw total: {int(total)}. Unable to convert - unknown measure type.')
+
+def handle_pedsql(result: Dict[str, Any], group: Dict[str, Any], q_info: Mapping[str, Any],
+                  total: float, name: str) -> None:
+    """PedsQL - Calculate both Total Score and Psychosocial Score for ratio-based interpretation"""
+    result['derived'].update(DERIVED_TEMPLATES['pedsql'])
+    
+    # Accumulate transformed sums and item counts per dimension id
+    # (0=Physical, 1=Emotional, 2=Social, 3=School) in a single pass
+    dimension_sums = [0, 0, 0, 0]
+    dimension_counts = [0, 0, 0, 0]
+    
+    # Categorize responses by question number, reading answers from the packed column
+    transform = PEDSQL_SCORE_TRANSFORM.get
+    for response, raw_score in zip(group['responses'], group['answers']):
+        transformed_score = transform(int(raw_score))
         
-        # PROMIS (Depression, Anxiety, Life Satisfaction)
-        elif 'promis' in name:
-            # T-score conversion tables
-            PROMIS_DEPRESSION_PEDIATRIC = {
-                8: 39.9, 9: 46.9, 10: 49.3, 11: 51.0, 12: 52.4, 13: 53.6, 14: 54.6, 15: 55.6,
-                16: 56.5, 17: 57.4, 18: 58.3, 19: 59.1, 20: 60.0, 21: 60.8, 22: 61.7, 23: 62.5,
-                24: 63.3, 25: 64.1, 26: 64.9, 27: 65.7, 28: 66.5, 29: 67.3, 30: 68.0, 31: 68.8,
-                32: 69.6, 33: 70.4, 34: 71.2, 35: 72.1, 36: 73.1, 37: 74.2, 38: 75.5, 39: 77.2, 40: 80.3
-            }
-            
-            PROMIS_ANXIETY_PEDIATRIC = {
-                8: 39.0, 9: 45.4, 10: 47.8, 11: 49.6, 12: 51.0, 13: 52.2, 14: 53.3, 15: 54.4,
-                16: 55.3, 17: 56.3, 18: 57.2, 19: 58.1, 20: 59.0, 21: 59.9, 22: 60.8, 23: 61.7,
-                24: 62.6, 25: 63.4, 26: 64.3, 27: 65.1, 28: 65.9, 29: 66.8, 30: 67.6, 31: 68.4,
-                32: 69.2, 33: 70.0, 34: 70.9, 35: 71.8, 36: 72.8, 37: 73.9, 38: 75.2, 39: 76.7, 40: 79.8
-            }
-            
-            PROMIS_LIFE_SATISFACTION_PEDIATRIC = {
-                8: 20.5, 9: 23.6, 10: 25.3, 11: 26.7, 12: 27.9, 13: 28.9, 14: 29.9, 15: 30.7,
-                16: 31.6, 17: 32.5, 18: 33.3, 19: 34.1, 20: 34.9, 21: 35.8, 22: 36.6, 23: 37.4,
-                24: 38.3, 25: 39.1, 26: 40.0, 27: 40.9, 28: 41.9, 29: 42.9, 30: 43.9, 31: 44.9,
-                32: 45.9, 33: 46.9, 34: 48.1, 35: 49.2, 36: 50.5, 37: 52.0, 38: 53.9, 39: 56.7, 40: 62.5
-            }
-            
-            PROMIS_DEPRESSION_PARENT = {
-                6: 40.8, 7: 48.2, 8: 51.1, 9: 53.2, 10: 54.9, 11: 56.4, 12: 57.9, 13: 59.2,
-                14: 60.6, 15: 61.9, 16: 63.2, 17: 64.6, 18: 65.9, 19: 67.1, 20: 68.3, 21: 69.6,
-                22: 70.7, 23: 71.9, 24: 73.0, 25: 74.2, 26: 75.4, 27: 76.7, 28: 78.2, 29: 79.8, 30: 82.7
-            }
-            
-            PROMIS_ANXIETY_PARENT = {
-                8: 38.8, 9: 45.2, 10: 48.0, 11: 49.9, 12: 51.5, 13: 52.8, 14: 54.0, 15: 55.2,
-                16: 56.3, 17: 57.3, 18: 58.4, 19: 59.4, 20: 60.4, 21: 61.4, 22: 62.5, 23: 63.4,
-                24: 64.4, 25: 65.3, 26: 66.3, 27: 67.2, 28: 68.1, 29: 69.0, 30: 69.9, 31: 70.8,
-                32: 71.7, 33: 72.6, 34: 73.5, 35: 74.5, 36: 75.6, 37: 76.8, 38: 78.2, 39: 80.0, 40: 82.7
-            }
-            
-            PROMIS_LIFE_SATISFACTION_PARENT = {
-                8: 18.5, 9: 21.4, 10: 22.9, 11: 24.1, 12: 25.2, 13: 26.1, 14: 27.0, 15: 27.8,
-                16: 28.6, 17: 29.4, 18: 30.2, 19: 31.0, 20: 31.8, 21: 32.7, 22: 33.5, 23: 34.4,
-                24: 35.3, 25: 36.2, 26: 37.2, 27: 38.2, 28: 39.2, 29: 40.3, 30: 41.5, 31: 42.7,
-                32: 43.9, 33: 45.1, 34: 46.4, 35: 47.7, 36: 49.1, 37: 50.6, 38: 52.5, 39: 55.2, 40: 61.5
-            }
-            
-            def get_promis_t_score(raw_total, conversion_table):
-                """Convert raw PROMIS score to T-score using lookup table"""
-                return conversion_table.get(raw_total, None)
-            
-            def interpret_promis_t_score(t_score, measure_type):
-                """Interpret PROMIS T-score based on measure type"""
-                if measure_type in ['depression', 'anxiety']:
-                    # Higher scores = worse (negative measures)
-                    if t_score <= 50:
-                        return {
-                            'severity': 'within normal limits',
-                            'interpretation': 'Within Normal Limits'
-                        }
-                    elif t_score <= 55:
-                        return {
-                            'severity': 'mild',
-                            'interpretation': 'Mild'
-                        }
-                    elif t_score <= 65:
-                        return {
-                            'severity': 'moderate',
-                            'interpretation': 'Moderate'
-                        }
-                    else:
-                        return {
-                            'severity': 'severe',
-                            'interpretation': 'Severe'
-                        }
-                else:  # life satisfaction
-                    # Higher scores = better (positive measure)
-                    if t_score >= 70:
-                        return {
-                            'severity': 'very high',
-                            'interpretation': 'Very High'
-                        }
-                    elif t_score >= 60:
-                        return {
-                            'severity': 'high',
-                            'interpretation': 'High'
-                        }
-                    elif t_score >= 40:
-                        return {
-                            'severity': 'average',
-                            'interpretation': 'Average'
-                        }
-                    elif t_score >= 30:
-                        return {
-                            'severity': 'low',
-                            'interpretation': 'Low'
-                        }
-                    else:
-                        return {
-                            'severity': 'very low',
-                            'interpretation': 'Very Low'
-                        }
-            
-            # Determine measure type and version
-            is_parent = 'parent' in name.lower()
-            measure_type = None
-            conversion_table = None
-            
-            if 'depression' in name:
-                measure_type = 'depression'
-                conversion_table = PROMIS_DEPRESSION_PARENT if is_parent else PROMIS_DEPRESSION_PEDIATRIC
-                result['derived']['scale'] = f'PROMIS Depression {"Parent Proxy" if is_parent else "Pediatric"} T-score (mean 50, SD 10, higher worse)'
-                result['derived']['note'] = 'Higher T-scores indicate more depression symptoms'
-            elif 'anxiety' in name:
-                measure_type = 'anxiety'
-                conversion_table = PROMIS_ANXIETY_PARENT if is_parent else PROMIS_ANXIETY_PEDIATRIC
-                result['derived']['scale'] = f'PROMIS Anxiety {"Parent Proxy" if is_parent else "Pediatric"} T-score (mean 50, SD 10, higher worse)'
-                result['derived']['note'] = 'Higher T-scores indicate more anxiety symptoms'
-            elif 'life' in name or 'satisfaction' in name:
-                measure_type = 'life_satisfaction'
-                conversion_table = PROMIS_LIFE_SATISFACTION_PARENT if is_parent else PROMIS_LIFE_SATISFACTION_PEDIATRIC
-                result['derived']['scale'] = f'PROMIS Life Satisfaction {"Parent Proxy" if is_parent else "Pediatric"} T-score (mean 50, SD 10, higher better)'
-                result['derived']['note'] = 'Higher T-scores indicate better life satisfaction'
-            else:
-                result['derived']['scale'] = 'PROMIS Pediatric T-score (mean 50, SD 10)'
-                result['derived']['note'] = 'Unknown PROMIS measure - cannot convert to T-score'
-            
-            # Store raw scores
-            result['derived']['raw_score'] = int(total)
-            result['derived']['total_score'] = int(total)
+        if transformed_score is not None:  # Valid score (0-4 range)
+            question_num = get_question_number(response['question'])
             
-            # Convert to T-score if table available
-            if conversion_table and measure_type:
-                t_score = get_promis_t_score(int(total), conversion_table)
-                
-                if t_score is not None:
-                    result['derived']['t_score'] = round(t_score, 1)
-                    
-                    # Get interpretation
-                    interpretation = interpret_promis_t_score(t_score, measure_type)
-                    result['severity'] = interpretation['severity']
-                    result['derived']['severity_level'] = result['severity']
-                    result['derived']['interpretation'] = interpretation['interpretation']
-                    
-                    # Add clinical flags based on T-score thresholds
-                    if measure_type in ['depression', 'anxiety']:
-                        if t_score > 65:
-                            result['clinical_flags'].append(f'PROMIS {measure_type.title()} T-score {t_score:.1f} (Severe - significant clinical concern)')
-                        elif t_score > 55:
-                            result['clinical_flags'].append(f'PROMIS {measure_type.title()} T-score {t_score:.1f} (Moderate - clinical attention warranted)')
-                        elif t_score > 50:
-                            result['clinical_flags'].append(f'PROMIS {measure_type.title()} T-score {t_score:.1f} (Mild - monitor)')
-                    else:  # life satisfaction
-                        if t_score < 30:
-                            result['clinical_flags'].append(f'PROMIS Life Satisfaction T-score {t_score:.1f} (Very Low - significant concern)')
-                        elif t_score < 40:
-                            result['clinical_flags'].append(f'PROMIS Life Satisfaction T-score {t_score:.1f} (Low - below average)')
-                    
-                    result['clinical_flags'].append(f'PROMIS {measure_type.replace("_", " ").title()}: Raw={int(total)}, T-score={t_score:.1f} ({interpretation["interpretation"]})')
-                
-                else:
-                    # Raw score outside conversion table range
-                    result['severity'] = 'raw score outside conversion range'
-                    result['derived']['severity_level'] = result['severity']
-                    result['clinical_flags'].append(f'PROMIS raw total {int(total)} outside conversion table range (8-40)')
-            
-            else:
-                # No conversion table available
-                result['severity'] = 'unknown PROMIS measure'
-                result['derived']['severity_level'] = result['severity']
-                result['clinical_flags'].append(f'PROMIS raw total: {int(total)}. Unable to convert - unknown measure type.')
+            if question_num is not None and 0 < question_num < len(PEDSQL_QUESTION_DIMENSIONS):
+                dim_id = PEDSQL_QUESTION_DIMENSIONS[question_num]
+                dimension_sums[dim_id] += transformed_score
+                dimension_counts[dim_id] += 1
+    
+    # Calculate dimension scores
+    dimension_scores = {}
+    total_sum = total_count = 0
+    psychosocial_sum = psychosocial_count = 0
+    
+    for dim_id, dimension_name in enumerate(PEDSQL_DIMENSION_ITEMS):
+        expected_items = PEDSQL_DIMENSION_ITEMS[dimension_name]
+        answered_items = dimension_counts[dim_id]
+        completion_rate = (answered_items / expected_items) * 100
         
-        # PedsQL - Calculate both Total Score and Psychosocial Score for ratio-based interpretation
-        elif 'pedsql' in name:
-            result['derived']['scale'] = 'PedsQL Psychosocial/Total Score (0-100, higher better)'
-            result['derived']['note'] = 'Scores reverse-transformed: 0→100, 1→75, 2→50, 3→25, 4→0. Interpretation based on Psychosocial/Total Score ratio'
-            
-            # Transform raw scores (0-4) to PedsQL scale (0-100)
-            def transform_pedsql_score(raw_score):
-                """Transform raw PedsQL score (0-4) to 0-100 scale"""
-                transformation_map = {0: 100, 1: 75, 2: 50, 3: 25, 4: 0}
-                return transformation_map.get(int(raw_score), None)
-            
-            # Extract question number from question text
-            def get_question_number(question_text):
-                """Extract question number from question text (e.g., '1. Question text' -> 1)"""
-                match = re.match(r'^(\d+)', str(question_text).strip())
-                if match:
-                    return int(match.group(1))
-                return None
-            
-            # Group responses by ALL dimensions (Physical + Psychosocial)
-            all_dimensions = {
-                'Physical': [],
-                'Emotional': [],
-                'Social': [],
-                'School': []
+        if answered_items >= (expected_items * 0.5):  # At least 50% answered
+            dimension_scores[dimension_name] = {
+                'score': dimension_sums[dim_id] / answered_items,
+                'items_answered': answered_items,
+                'items_expected': expected_items,
+                'completion_rate': completion_rate
             }
+            # Add dimension to total pool
+            total_sum += dimension_sums[dim_id]
+            total_count += answered_items
             
-            # Categorize responses by question number
-            # Questions 1-8: Physical, 9-13: Emotional, 14-18: Social, 19-23: School
-            for response in group['responses']:
-                raw_score = response.get('answer', 0)
-                question_text = response.get('question', '')
-                transformed_score = transform_pedsql_score(raw_score)
-                
-                if transformed_score is not None:  # Valid score (0-4 range)
-                    question_num = get_question_number(question_text)
-                    
-                    if question_num is not None:
-                        if 1 <= question_num <= 8:
-                            all_dimensions['Physical'].append(transformed_score)
-                        elif 9 <= question_num <= 13:
-                            all_dimensions['Emotional'].append(transformed_score)
-                        elif 14 <= question_num <= 18:
-                            all_dimensions['Social'].append(transformed_score)
-                        elif 19 <= question_num <= 23:
-                            all_dimensions['School'].append(transformed_score)
-            
-            # Define expected items per dimension
-            PEDSQL_DIMENSION_ITEMS = {
-                'Physical': 8,      # Physical Functioning (8 items)
-                'Emotional': 5,     # Emotional Functioning (5 items) 
-                'Social': 5,        # Social Functioning (5 items)
-                'School': 5         # School Functioning (5 items)
+            # Add psychosocial dimensions (exclude Physical)
+            if dim_id:
+                psychosocial_sum += dimension_sums[dim_id]
+                psychosocial_count += answered_items
+        else:
+            # Don't calculate score - insufficient data
+            dimension_scores[dimension_name] = {
+                'score': None,
+                'items_answered': answered_items,
+                'items_expected': expected_items,
+                'completion_rate': completion_rate,
+                'reason': 'Insufficient data (>50% missing)'
             }
-            
-            # Calculate dimension scores
-            dimension_scores = {}
-            all_total_scores = []
-            all_psychosocial_scores = []
-            
-            for dimension_name, scores in all_dimensions.items():
-                expected_items = PEDSQL_DIMENSION_ITEMS.get(dimension_name, len(scores))
-                answered_items = len(scores)
-                
-                if answered_items >= (expected_items * 0.5):  # At least 50% answered
-                    dimension_mean = sum(scores) / len(scores)
-                    dimension_scores[dimension_name] = {
-                        'score': round(dimension_mean, 2),
-                        'items_answered': answered_items,
-                        'items_expected': expected_items,
-                        'completion_rate': round((answered_items / expected_items) * 100, 1)
-                    }
-                    # Add all individual scores to total pool
-                    all_total_scores.extend(scores)
-                    
-                    # Add psychosocial scores (exclude Physical)
-                    if dimension_name in ['Emotional', 'Social', 'School']:
-                        all_psychosocial_scores.extend(scores)
-                else:
-                    # Don't calculate score - insufficient data
-                    dimension_scores[dimension_name] = {
-                        'score': None,
-                        'items_answered': answered_items,
-                        'items_expected': expected_items,
-                        'completion_rate': round((answered_items / expected_items) * 100, 1),
-                        'reason': 'Insufficient data (>50% missing)'
-                    }
-            
-            # Store detailed results
-            result['derived']['dimension_scores'] = dimension_scores
-            result['derived']['raw_total'] = int(total)  # Keep original sum for reference
-            
-            # Calculate Total Score and Psychosocial Score
-            if all_total_scores and all_psychosocial_scores:
-                total_score = sum(all_total_scores) / len(all_total_scores)
-                psychosocial_score = sum(all_psychosocial_scores) / len(all_psychosocial_scores)
-                
-                # Calculate Psychosocial/Total Score ratio (psychosocial score divided by total score as percentage)
-                psychosocial_total_ratio = (psychosocial_score / total_score) * 100 if total_score > 0 else 0
-                
-                result['derived']['total_score'] = round(total_score, 2)
-                result['derived']['psychosocial_score'] = round(psychosocial_score, 2)
-                result['derived']['psychosocial_total_ratio'] = round(psychosocial_total_ratio, 2)
-                
-                # PedsQL interpretation function based on reference table
-                def get_pedsql_interpretation(score):
-                    """Get PedsQL interpretation based on reference table for Psychosocial/Total Score"""
-                    if score >= 80:
-                        return {
-                            'severity': 'typical range',
-                            'interpretation': 'Typical range',
-                            'mental_health_status': 'Normal wellbeing'
-                        }
-                    elif score >= 70:
-                        return {
-                            'severity': 'slightly below norms',
-                            'interpretation': 'Slightly below norms', 
-                            'mental_health_status': 'Mild emotional or adjustment difficulties'
-                        }
-                    elif score >= 60:
-                        return {
-                            'severity': 'noticeably below average',
-                            'interpretation': 'Noticeably below average',
-                            'mental_health_status': 'Possible clinical concern — monitor or screen further'
-                        }
-                    else:  # < 60
-                        return {
-                            'severity': 'significantly impaired',
-                            'interpretation': 'Significantly impaired',
-                            'mental_health_status': 'Likely emotional/mental-health problems'
-                        }
-                
-                # Apply interpretation to Psychosocial/Total Score ratio
-                ratio_interpretation = get_pedsql_interpretation(psychosocial_total_ratio)
-                result['severity'] = ratio_interpretation['severity']
-                result['derived']['severity_level'] = result['severity']
-                result['derived']['interpretation'] = ratio_interpretation['interpretation']
-                result['derived']['mental_health_status'] = ratio_interpretation['mental_health_status']
-                
-                # Add clinical flags based on Psychosocial/Total Score ratio interpretation
-                if psychosocial_total_ratio < 60:
-                    result['clinical_flags'].append(f'PedsQL Psychosocial/Total Score {psychosocial_total_ratio:.1f} < 60 (significantly impaired - likely emotional/mental-health problems)')
-                elif psychosocial_total_ratio < 70:
-                    result['clinical_flags'].append(f'PedsQL Psychosocial/Total Score {psychosocial_total_ratio:.1f} (60-69: noticeably below average - possible clinical concern)')
-                elif psychosocial_total_ratio < 80:
-                    result['clinical_flags'].append(f'PedsQL Psychosocial/Total Score {psychosocial_total_ratio:.1f} (70-79: slightly below norms - mild emotional/adjustment difficulties)')
-                
-                # Add component scores for reference
-                result['clinical_flags'].append(f'PedsQL Total Score: {total_score:.1f}, Psychosocial Score: {psychosocial_score:.1f}, Ratio: {psychosocial_total_ratio:.1f}%')
-                
-                # Add flags for dimensions with insufficient data
-                for dimension_name, dimension_data in dimension_scores.items():
-                    dimension_score = dimension_data.get('score')
-                    if dimension_score is None:
-                        # Flag dimensions with insufficient data
-                        completion_rate = dimension_data.get('completion_rate', 0)
-                        result['clinical_flags'].append(f'PedsQL {dimension_name}: Insufficient data ({completion_rate}% complete, need ≥50%)')
-            
-            else:
-                result['severity'] = 'insufficient valid responses'
-                result['derived']['severity_level'] = result['severity']
-                result['clinical_flags'].append('PedsQL: No valid responses in 0-4 range for transformation')
+    
+    # Raw floats are kept above; round once for output
+    round_pedsql_dimension_scores(dimension_scores)
+    
+    # Assemble derived fields and flags locally, then store them once
+    derived = {
+        'dimension_scores': dimension_scores,
+        'raw_total': int(total)  # Keep original sum for reference
+    }
+    flags = []
+    
+    # Calculate Total Score and Psychosocial Score
+    if total_count and psychosocial_count:
+        total_score = total_sum / total_count
+        psychosocial_score = psychosocial_sum / psychosocial_count
         
-        # CES-DC
-        elif any(x in name for x in ['ces-dc', 'cesdc', 'ces dc']):
-            result['derived']['scale'] = 'CES-DC (≥15 suggests risk for depression)'
-            result['derived']['total_score'] = int(total)
-            result['severity'] = 'depression risk (≥15)' if total >= 15 else 'below risk threshold'
-            result['derived']['severity_level'] = result['severity']
-            if total >= 15:
-                result['clinical_flags'].append('CES-DC positive screen (≥15)')
+        # Calculate Psychosocial/Total Score ratio (psychosocial score divided by total score as percentage)
+        psychosocial_total_ratio = (psychosocial_score / total_score) * 100 if total_score > 0 else 0
         
-        # SCARED
-        elif 'scared' in name:
-            result['derived']['scale'] = 'SCARED (total ≥25 possible anxiety disorder; subscale cut-offs apply)'
-            result['derived']['total_score'] = int(total)
-            result['severity'] = 'possible anxiety disorder (≥25)' if total >= 25 else 'below screening threshold'
-            result['derived']['severity_level'] = result['severity']
-            
-            # Subscales by dimension
-            subscales = score_subscales(group['responses'], {
-                'Panic': lambda r: includes_any(r['dimension'], ['panic']),
-                'Generalized Anxiety (GAD)': lambda r: includes_any(r['dimension'], ['gad', 'generalized']),
-                'Separation': lambda r: includes_any(r['dimension'], ['separation']),
-                'Social': lambda r: includes_any(r['dimension'], ['social']),
-                'School Phobia': lambda r: includes_any(r['dimension'], ['school'])
-            })
-            result['derived']['subscales'] = subscales
-            
-            # Subscale flags
-            if subscales.get('Panic', {}).get('total', 0) >= 7:
-                result['clinical_flags'].append('SCARED Panic ≥7')
-            if subscales.get('Social', {}).get('total', 0) >= 8:
-                result['clinical_flags'].append('SCARED Social ≥8')
-            if subscales.get('School Phobia', {}).get('total', 0) >= 3:
-                result['clinical_flags'].append('SCARED School ≥3')
-            if subscales.get('Separation', {}).get('total', 0) >= 5:
-                result['clinical_flags'].append('SCARED Separation ≥5')
-            if subscales.get('Generalized Anxiety (GAD)', {}).get('total', 0) >= 9:
-                result['clinical_flags'].append('SCARED GAD ≥9')
+        # Apply interpretation to Psychosocial/Total Score ratio
+        ratio_interpretation = get_pedsql_interpretation(psychosocial_total_ratio)
+        result['severity'] = ratio_interpretation['severity']
         
-        # RSES
-        elif any(x in name for x in ['rosenberg', 'rses']):
-            result['derived']['scale'] = 'RSES (0-30; <15 low, 15-25 normal, >25 high)'
-            result['derived']['note'] = 'Contains reverse-scored items; verify scoring before interpretation'
-            result['derived']['total_score'] = int(total)
-            result['severity'] = rses_band(int(total))
-            result['derived']['severity_level'] = result['severity']
+        # Round the aggregate scores only in this final projection step
+        derived['total_score'] = round(total_score, 2)
+        derived['psychosocial_score'] = round(psychosocial_score, 2)
+        derived['psychosocial_total_ratio'] = round(psychosocial_total_ratio, 2)
+        derived['severity_level'] = result['severity']
+        derived['interpretation'] = ratio_interpretation['interpretation']
+        derived['mental_health_status'] = ratio_interpretation['mental_health_status']
         
-        # SDQ - Enhanced with version-specific interpretation
-        elif 'sdq' in name:
-            # Detect version (parent or self-completed)
-            sdq_version = detect_sdq_version(group['questionnaire'])
-            sdq_cutoffs = get_sdq_cutoffs(sdq_version)
-            
-            # Subscales by dimension
-            subscales = score_subscales(group['responses'], {
-                'Emotional': lambda r: includes_any(r['dimension'], ['emotional']),
-                'Conduct': lambda r: includes_any(r['dimension'], ['conduct']),
-                'Hyperactivity/Inattention': lambda r: includes_any(r['dimension'], ['hyperactivity', 'inattention']),
-                'Peer Problems': lambda r: includes_any(r['dimension'], ['peer']),
-                'Prosocial': lambda r: includes_any(r['dimension'], ['prosocial'])
-            })
-            
-            # Total difficulties (exclude Prosocial)
-            total_difficulties = (
-                subscales.get('Emotional', {}).get('total', 0) +
-                subscales.get('Conduct', {}).get('total', 0) +
-                subscales.get('Hyperactivity/Inattention', {}).get('total', 0) +
-                subscales.get('Peer Problems', {}).get('total', 0)
-            )
-            
-            # Store raw scores
-            result['derived']['raw_scores'] = {
-                'total_difficulties': total_difficulties,
-                'emotional': subscales.get('Emotional', {}).get('total', 0),
-                'conduct': subscales.get('Conduct', {}).get('total', 0),
-                'hyperactivity': subscales.get('Hyperactivity/Inattention', {}).get('total', 0),
-                'peer_problems': subscales.get('Peer Problems', {}).get('total', 0),
-                'prosocial': subscales.get('Prosocial', {}).get('total', 0)
-            }
-            
-            # Store subscale details for reference
-            result['derived']['subscales'] = subscales
-            
-            # Interpret all scores using version-specific cut-offs
-            result['derived']['interpretations'] = {
-                'version': sdq_version,
-                'total_difficulties': interpret_sdq_score(total_difficulties, 'total_difficulties', sdq_cutoffs),
-                'emotional': interpret_sdq_score(result['derived']['raw_scores']['emotional'], 'emotional', sdq_cutoffs),
-                'conduct': interpret_sdq_score(result['derived']['raw_scores']['conduct'], 'conduct', sdq_cutoffs),
-                'hyperactivity': interpret_sdq_score(result['derived']['raw_scores']['hyperactivity'], 'hyperactivity', sdq_cutoffs),
-                'peer_problems': interpret_sdq_score(result['derived']['raw_scores']['peer_problems'], 'peer_problems', sdq_cutoffs),
-                'prosocial': interpret_sdq_score(result['derived']['raw_scores']['prosocial'], 'prosocial', sdq_cutoffs)
-            }
-            
-            # Set overall severity based on total difficulties
-            total_diff_interpretation = result['derived']['interpretations']['total_difficulties']
-            result['severity'] = total_diff_interpretation['band']
-            
-            # Add scale information with version-specific cut-offs
-            if sdq_version == 'self_completed':
-                result['derived']['scale'] = 'SDQ Total Difficulties - Self-Completed (0-15 normal, 16-19 borderline, 20-40 abnormal)'
-            else:
-                result['derived']['scale'] = 'SDQ Total Difficulties - Parent/Teacher (0-13 normal, 14-16 borderline, 17-40 abnormal)'
-            
-            # Add clinical flags for abnormal subscales
-            for subscale_name, interpretation in result['derived']['interpretations'].items():
-                if subscale_name != 'version' and interpretation.get('band') == 'abnormal':
-                    result['clinical_flags'].append(
-                        f"SDQ {subscale_name.replace('_', ' ').title()}: {interpretation['score']} - {interpretation['interpretation']}"
-                    )
+        # Add clinical flags based on Psychosocial/Total Score ratio interpretation
+        if psychosocial_total_ratio < 60:
+            flags.append(f'PedsQL Psychosocial/Total Score {psychosocial_total_ratio:.1f} < 60 (significantly impaired - likely emotional/mental-health problems)')
+        elif psychosocial_total_ratio < 70:
+            flags.append(f'PedsQL Psychosocial/Total Score {psychosocial_total_ratio:.1f} (60-69: noticeably below average - possible clinical concern)')
+        elif psychosocial_total_ratio < 80:
+            flags.append(f'PedsQL Psychosocial/Total Score {psychosocial_total_ratio:.1f} (70-79: slightly below norms - mild emotional/adjustment difficulties)')
         
-        # PSC-17
-        elif any(x in name for x in ['psc-17', 'psc17', 'psc 17', 'Pediatric Symptom Checklist – 17 (PSC-17)', 'psc']):
-            # PSC-17 processing (quiet)
-            result['derived']['scale'] = 'PSC-17 (total ≥15 positive; subscales Internalizing ≥5, Attention ≥7, Externalizing ≥7)'
-            result['derived']['total_score'] = int(total)
-            result['severity'] = 'positive screen (≥15)' if total >= 15 else 'below threshold'
-            result['derived']['severity_level'] = result['severity']
-            
-            # Subscales by dimension
-            subscales = score_subscales(group['responses'], {
-                'Internalizing': lambda r: includes_any(r['dimension'], ['internalizing']),
-                'Attention': lambda r: includes_any(r['dimension'], ['attention']),
-                'Externalizing': lambda r: includes_any(r['dimension'], ['externalizing'])
-            })
-            result['derived']['subscales'] = subscales
-            
-            # Subscale flags
-            if subscales.get('Internalizing', {}).get('total', 0) >= 5:
-                result['clinical_flags'].append('PSC-17 Internalizing ≥5')
-            if subscales.get('Attention', {}).get('total', 0) >= 7:
-                result['clinical_flags'].append('PSC-17 Attention ≥7')
-            if subscales.get('Externalizing', {}).get('total', 0) >= 7:
-                result['clinical_flags'].append('PSC-17 Externalizing ≥7')
+        # Add component scores for reference
+        flags.append(f'PedsQL Total Score: {total_score:.1f}, Psychosocial Score: {psychosocial_score:.1f}, Ratio: {psychosocial_total_ratio:.1f}%')
         
-        # All other questionnaires - use generic cut-off approach
-        else:
-            # Generic processing (quiet)
-            cutoffs = q_info.get('cutoffs', {})
-            result['severity'] = 'see cut-offs for interpretation'
-            result['derived']['scale'] = f'{group["questionnaire"]} ({q_info.get("scale_range", "unknown range")})'
-            result['derived']['total_score'] = int(total)
-            result['derived']['direction'] = q_info.get('direction', 'unknown')
-            
-            # Apply any available cut-offs generically
-            for threshold_name, threshold_value in cutoffs.items():
-                if isinstance(threshold_value, (int, float)):
-                    direction = q_info.get('direction', 'higher worse')
-                    if 'higher' in direction and total >= threshold_value:
-                        result['clinical_flags'].append(f'{group["questionnaire"]} ≥{threshold_value} ({threshold_name.replace("_", " ")})')
-                    elif 'lower' in direction and total <= threshold_value:
-                        result['clinical_flags'].append(f'{group["questionnaire"]} ≤{threshold_value} ({threshold_name.replace("_", " ")})')
-            
-            # Handle subscales if available
-            subscales_info = q_info.get('subscales', {})
-            if subscales_info:
-                result['derived']['subscale_cutoffs'] = subscales_info
+        # Add flags for dimensions with insufficient data
+        for dimension_name, dimension_data in dimension_scores.items():
+            dimension_score = dimension_data.get('score')
+            if dimension_score is None:
+                # Flag dimensions with insufficient data
+                completion_rate = dimension_data.get('completion_rate', 0)
+                flags.append(f'PedsQL {dimension_name}: Insufficient data ({completion_rate}% complete, need ≥50%)')
+    
+    else:
+        result['severity'] = 'insufficient valid responses'
+        derived['severity_level'] = result['severity']
+        flags.append('PedsQL: No valid responses in 0-4 range for transformation')
+    
+    result['derived'].update(derived)
+    result['clinical_flags'] += flags
+
+def handle_cesdc(result: Dict[str, Any], group: Dict[str, Any], q_info: Mapping[str, Any],
+                 total: float, name: str) -> None:
+    """CES-DC"""
+    # Most screens are negative, so test that case first and only flag positives
+    if total < 15:
+        result['severity'] = 'below risk threshold'
+    else:
+        result['severity'] = 'depression risk (≥15)'
+        result['clinical_flags'].append('CES-DC positive screen (≥15)')
+    result['derived'].update(DERIVED_TEMPLATES['cesdc'])
+    result['derived'].update({
+        'total_score': int(total),
+        'severity_level': result['severity']
+    })
+
+def handle_scared(result: Dict[str, Any], group: Dict[str, Any], q_info: Mapping[str, Any],
+                  total: float, name: str) -> None:
+    """SCARED"""
+    result['severity'] = 'below screening threshold' if total < 25 else 'possible anxiety disorder (≥25)'
+    
+    # Subscales by dimension
+    subscales = score_subscales(group['responses'], group['answers'], SCARED_SUBSCALE_MATCHERS)
+    result['derived'].update(DERIVED_TEMPLATES['scared'])
+    result['derived'].update({
+        'total_score': int(total),
+        'severity_level': result['severity'],
+        'subscales': subscales
+    })
+    
+    # Subscale flags
+    result['clinical_flags'] += subscale_flags(subscales, SCARED_SUBSCALE_FLAGS)
+
+def handle_rses(result: Dict[str, Any], group: Dict[str, Any], q_info: Mapping[str, Any],
+                total: float, name: str) -> None:
+    """RSES"""
+    result['derived'].update(DERIVED_TEMPLATES['rses'])
+    result['derived']['total_score'] = int(total)
+    result['severity'] = rses_band(int(total))
+    result['derived']['severity_level'] = result['severity']
+
+# SDQ raw-score keys and the subscale each is read from, in output order
+SDQ_SCORE_KEYS = (
+    ('emotional', 'Emotional'),
+    ('conduct', 'Conduct'),
+    ('hyperactivity', 'Hyperactivity/Inattention'),
+    ('peer_problems', 'Peer Problems'),
+    ('prosocial', 'Prosocial')
+)
+SDQ_DIFFICULTY_KEYS = frozenset({'emotional', 'conduct', 'hyperactivity', 'peer_problems'})
+
+def handle_sdq(result: Dict[str, Any], group: Dict[str, Any], q_info: Mapping[str, Any],
+               total: float, name: str) -> None:
+    """SDQ - Enhanced with version-specific interpretation"""
+    # Detect version (parent or self-completed)
+    sdq_version = detect_sdq_version(group['questionnaire'])
+    sdq_cutoffs = get_sdq_cutoffs(sdq_version)
+    
+    # Subscales by dimension
+    subscales = score_subscales(group['responses'], group['answers'], SDQ_SUBSCALE_MATCHERS)
+    
+    # Store raw scores: total difficulties (excluding Prosocial) first, then each subscale
+    subscale_scores = {key: subscales[subscale_name]['total'] for key, subscale_name in SDQ_SCORE_KEYS}
+    total_difficulties = sum(
+        score for key, score in subscale_scores.items() if key in SDQ_DIFFICULTY_KEYS
+    )
+    raw_scores = {'total_difficulties': total_difficulties}
+    raw_scores.update(subscale_scores)
+    
+    # Interpret all scores using version-specific cut-offs
+    interpretations = {'version': sdq_version}
+    for key, score in raw_scores.items():
+        interpretations[key] = interpret_sdq_score(score, key, sdq_cutoffs)
+    
+    # Set overall severity based on total difficulties
+    result['severity'] = interpretations['total_difficulties']['band']
+    
+    # Store raw scores, subscale details and interpretations with version-specific scale info
+    result['derived'].update({
+        'raw_scores': raw_scores,
+        'subscales': subscales,
+        'interpretations': interpretations,
+        'scale': (
+            'SDQ Total Difficulties - Self-Completed (0-15 normal, 16-19 borderline, 20-40 abnormal)'
+            if sdq_version == 'self_completed' else
+            'SDQ Total Difficulties - Parent/Teacher (0-13 normal, 14-16 borderline, 17-40 abnormal)'
+        )
+    })
+    
+    # Add clinical flags for abnormal subscales
+    result['clinical_flags'] += [
+        f"SDQ {subscale_name.replace('_', ' ').title()}: {interpretation['score']} - {interpretation['interpretation']}"
+        for subscale_name, interpretation in interpretations.items()
+        if subscale_name != 'version' and interpretation.get('band') == 'abnormal'
+    ]
+
+def handle_psc17(result: Dict[str, Any], group: Dict[str, Any], q_info: Mapping[str, Any],
+                 total: float, name: str) -> None:
+    """PSC-17"""
+    # PSC-17 processing (quiet)
+    result['severity'] = 'below threshold' if total < 15 else 'positive screen (≥15)'
+    result['derived'].update(DERIVED_TEMPLATES['psc17'])
+    result['derived'].update({
+        'total_score': int(total),
+        'severity_level': result['severity']
+    })
+    
+    # Subscales by dimension
+    subscales = score_subscales(group['responses'], group['answers'], PSC17_SUBSCALE_MATCHERS)
+    result['derived']['subscales'] = subscales
+    
+    # Subscale flags
+    result['clinical_flags'] += subscale_flags(subscales, PSC17_SUBSCALE_FLAGS)
+
+def handle_generic(result: Dict[str, Any], group: Dict[str, Any], q_info: Mapping[str, Any],
+                   total: float, name: str) -> None:
+    """All other questionnaires - use generic cut-off approach"""
+    # Generic processing (quiet)
+    cutoffs = q_info.get('cutoffs', {})
+    result['severity'] = 'see cut-offs for interpretation'
+    result['derived']['scale'] = f'{group["questionnaire"]} ({q_info.get("scale_range", "unknown range")})'
+    result['derived']['total_score'] = int(total)
+    result['derived']['direction'] = q_info.get('direction', 'unknown')
+    
+    # Apply any available cut-offs generically; the direction is resolved once
+    direction = q_info.get('direction', 'higher worse')
+    higher_worse = 'higher' in direction
+    lower_worse = 'lower' in direction
+    questionnaire = group['questionnaire']
+    for threshold_name, threshold_value in cutoffs.items():
+        if isinstance(threshold_value, (int, float)):
+            if higher_worse and total >= threshold_value:
+                result['clinical_flags'].append(f'{questionnaire} ≥{threshold_value} ({threshold_name.replace("_", " ")})')
+            elif lower_worse and total <= threshold_value:
+                result['clinical_flags'].append(f'{questionnaire} ≤{threshold_value} ({threshold_name.replace("_", " ")})')
+    
+    # Handle subscales if available
+    subscales_info = q_info.get('subscales', {})
+    if subscales_info:
+        result['derived']['subscale_cutoffs'] = subscales_info
+
+# Questionnaire tags in dispatch precedence order; each tag is one capture group below
+QUESTIONNAIRE_TAGS = ('phq9', 'who5', 'gad7', 'promis', 'pedsql', 'cesdc', 'scared', 'rses', 'sdq', 'psc17')
+# (zero-width lookahead so overlapping aliases such as 'pscared' are all seen)
+QUESTIONNAIRE_TAG_RE = re.compile(
+    r'(?=(phq)|(who[- ]?5)|(gad[- ]?7)|(promis)|(pedsql)|(ces[- ]?dc)|(scared)|(rosenberg|rses)|(sdq)|(psc))'
+)
+
+QUESTIONNAIRE_HANDLERS = {
+    'phq9': handle_phq9,
+    'who5': handle_who5,
+    'gad7': handle_gad7,
+    'promis': handle_promis,
+    'pedsql': handle_pedsql,
+    'cesdc': handle_cesdc,
+    'scared': handle_scared,
+    'rses': handle_rses,
+    'sdq': handle_sdq,
+    'psc17': handle_psc17
+}
+
+def get_questionnaire_tag(name: str) -> Optional[str]:
+    """Return the canonical tag for a normalized questionnaire name (None if unrecognized)"""
+    # One regex pass; when several tags occur the highest-precedence one wins
+    group_index = min((match.lastindex for match in QUESTIONNAIRE_TAG_RE.finditer(name)), default=None)
+    return QUESTIONNAIRE_TAGS[group_index - 1] if group_index else None
+
+def process_questionnaire_group(group: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Score and interpret one questionnaire group (one questionnaire at one timepoint)
+    
+    Args:
+        group: Grouped responses with questionnaire (and its normalized form), timepoint, date, responses,
+               the packed answers column and free_text
+        
+    Returns:
+        Result dict with computed scores, severity and clinical flags
+    """
+    # Step B stores the normalized name on the group; fall back for hand-built groups
+    name = group.get('questionnaire_norm') or normalize_text(group['questionnaire'])
+    total = sum(group['answers'])
+    
+    # Get questionnaire-specific cut-off information (case variants share one cache entry)
+    q_info = get_questionnaire_info(name)
+    
+    result = {
+        'questionnaire': group['questionnaire'],
+        'timepoint': group['timepoint'],
+        'date': group['date'],
+        'raw_total': int(total),
+        'scale_info': {
+            'range': q_info.get('scale_range', 'unknown'),
+            'direction': q_info.get('direction', 'unknown'),
+            'cutoffs': q_info.get('cutoffs', {})
+        },
+        'severity': '',
+        'clinical_flags': [],
+        'derived': {},  # Initialize derived dictionary
+        'responses': group['responses'],
+        'free_text': group['free_text']
+    }
+    
+    # Dispatch to the questionnaire-specific handler
+    handler = QUESTIONNAIRE_HANDLERS.get(get_questionnaire_tag(name), handle_generic)
+    handler(result, group, q_info, total, name)
+    
+    return result
+
+# Placeholder questionnaire values left by spreadsheet/pandas exports for metadata rows
+INVALID_QUESTIONNAIRE_NAMES = frozenset({'nan', 'none', '<na>', 'null'})
+INVALID_QUESTIONNAIRE_MAX_LEN = max(len(name) for name in INVALID_QUESTIONNAIRE_NAMES)
+
+# Shared stand-in for items without a 'json' payload (read-only, never stored in output)
+NO_JSON = MappingProxyType({})
+
+def iter_preprocessed(items: List[Dict]) -> Iterator[Dict]:
+    """
+    Preprocess questionnaire data, yielding one processed item per group
+    
+    Args:
+        items: List of raw questionnaire items from n8n
+        
+    Yields:
+        Processed items with computed scores, severities, and flags
+    """
+    
+    # Start preprocessing (quiet mode for n8n Code node)
+    
+    # Steps A+B: Normalize each row and group it by questionnaire + timepoint in one pass
+    groups = {}
+    
+    # Dates and timepoints repeat on every row of a form, so each distinct
+    # raw value is converted once per batch rather than once per row
+    date_cache = {}
+    timepoint_cache = {}
+    
+    for item in items:
+        json_data = item.get('json', NO_JSON)
+        get = json_data.get
+        questionnaire = str(get('questionnaire', '')).strip()
+        
+        # Skip rows with NaN/None/empty questionnaire (metadata rows); only
+        # names as short as the placeholders need lowercasing to check
+        if not questionnaire or (len(questionnaire) <= INVALID_QUESTIONNAIRE_MAX_LEN
+                                 and questionnaire.lower() in INVALID_QUESTIONNAIRE_NAMES):
+            continue
+        
+        # Try both 'timepoint' (singular) and 'timepoints' (plural) for flexibility
+        timepoint_value = get('timepoint', get('timepoints', 0))
+        date_str = convert_cached(get('date'), to_iso_date, date_cache)
+        dim_str = str(get('dimension', '')).strip()
+        answer = safe_number(get('answer', 0))
+        timepoint = convert_cached(timepoint_value, safe_round, timepoint_cache)
+        free_text = get('free_text')
+        # NaN is the only value not equal to itself; spreadsheet exports use it for empty cells
+        free_text = '' if not free_text or (isinstance(free_text, float) and free_text != free_text) else str(free_text).strip()
+
+        # Note: We no longer skip rows that are missing timepoint/date/dimension; they will be included as-is
+        
+        key = (questionnaire, timepoint)
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = {
+                'questionnaire': questionnaire,
+                'questionnaire_norm': sys.intern(questionnaire.lower()),
+                'timepoint': timepoint,
+                'date': date_str,
+                'responses': [],
+                'answers': array('d'),  # Packed answer column, parallel to responses
+                'free_text': free_text,
+                'free_text_seen': {free_text}  # Texts already in (or contained by) free_text
+            }
         
-        results.append({'json': result})
+        # Accumulate free text if present in this row; repeats of the same note are
+        # caught by the set before falling back to the substring scan
+        if free_text and free_text not in group['free_text_seen']:
+            group['free_text_seen'].add(free_text)
+            if free_text not in group['free_text']:
+                if group['free_text']:
+                    group['free_text'] += ' | ' + free_text
+                else:
+                    group['free_text'] = free_text
+        
+        group['responses'].append({
+            'question': str(get('question', '')).strip(),
+            'answer': answer,
+            'dimension': dim_str,
+            'response_options': str(get('response_options', '')).strip()
+        })
+        group['answers'].append(answer)
+    
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("🔍 PREPROCESSING: %d items -> %d questionnaire/timepoint groups", len(items), len(groups))
+        logger.debug("🔍 PREPROCESSING: Groups: %s", list(groups))
+    
+    # Step C: Process each questionnaire group with cut-off focus
+    # Groups are independent, so each one is scored and handed on as soon as it is ready
+    for group in groups.values():
+        yield {'json': process_questionnaire_group(group)}
+
+def preprocess_questionnaire_data(items: List[Dict]) -> List[Dict]:
+    """
+    Main preprocessing function for questionnaire data
     
-    return results
+    Args:
+        items: List of raw questionnaire items from n8n
+        
+    Returns:
+        List of processed items with computed scores, severities, and flags
+    """
+    return list(iter_preprocessed(items))
+
+def build_error_details(error: Exception, items: Any) -> Dict[str, Any]:
+    """Build the error payload returned to n8n (call from inside an except block)"""
+    return {
+        'error_message': str(error),
+        'error_type': type(error).__name__,
+        'input_items_count': len(items) if items is not None else 0,
+        'traceback': traceback.format_exc(),
+        'debug_info': {
+            'items_available': items is not None,
+            'items_type': type(items).__name__ if items is not None else 'undefined',
+            'help': 'Ensure this node receives a list of items with a json payload per row.'
+        }
+    }
 
 # =============================================================================
 # n8n CODE NODE EXECUTION (Direct execution - no function wrappers)
@@ -964,19 +1221,12 @@ def preprocess_questionnaire_data(items: List[Dict]) -> List[Dict]:
 if 'items' in globals():
     try:
         processed_items = preprocess_questionnaire_data(items)
+        if logger.isEnabledFor(logging.DEBUG):
+            for processed in processed_items:
+                result = processed['json']
+                flags_summary = ', '.join(result['clinical_flags']) or 'no flags'
+                logger.debug("📊 %s @ T%s: total=%s (%s)", result['questionnaire'], result['timepoint'], result['raw_total'], flags_summary)
         return processed_items
     except Exception as e:
-        import traceback
-        error_details = {
-            'error_message': str(e),
-            'error_type': type(e).__name__,
-            'input_items_count': len(items) if 'items' in globals() else 0,
-            'traceback': traceback.format_exc(),
-            'debug_info': {
-                'items_available': 'items' in globals(),
-                'items_type': type(items).__name__ if 'items' in globals() else 'undefined',
-                'help': 'Ensure this node receives a list of items with a json payload per row.'
-            }
-        }
-        return [{'json': error_details}]
+        return [{'json': build_error_details(e, items)}]
 
@@ -3,8 +3,25 @@
 # Based on administration frequency and clinical significance guidelines
 
 import json
+import logging
+import os
+import re
+import traceback
+from collections import Counter, defaultdict
 from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional
+from functools import lru_cache
+from operator import itemgetter
+from types import MappingProxyType, SimpleNamespace
+from typing import Dict, List, Any, Optional, Tuple
+
+# Warnings and errors always go to stderr; per-run debug summaries are opt-in (N8N_TREND_DEBUG=1)
+# so the n8n happy path does no formatting or I/O for them
+DEBUG = os.environ.get('N8N_TREND_DEBUG') == '1'
+
+logger = logging.getLogger('n8n_trend_analyzer')
+if DEBUG and not logger.handlers:
+    logger.setLevel(logging.DEBUG)
+    logger.addHandler(logging.StreamHandler())
 
 # Clinical trend interpretation based on reference table
 TREND_GUIDELINES = {
@@ -109,8 +126,29 @@ TREND_GUIDELINES = {
     }
 }
 
+# Attribute-access view of TREND_GUIDELINES for the analysis loop (read-only table)
+GUIDELINE_RECORDS = MappingProxyType({key: SimpleNamespace(**info) for key, info in TREND_GUIDELINES.items()})
+
+def unknown_guidelines(questionnaire: str) -> SimpleNamespace:
+    """Fallback guidelines for questionnaires without a TREND_GUIDELINES entry"""
+    return SimpleNamespace(
+        name=questionnaire,
+        frequency="unknown",
+        sensitivity="unknown",
+        improvement_direction="decrease"
+    )
+
+# Sort position for results without a usable date
+EARLIEST_DATE = datetime(1900, 1, 1)
+
+# Guideline keys in precedence order, and one regex that finds all of them in a single scan
+# (each key is a capture group inside a lookahead so overlapping keys are all seen)
+TREND_KEYS = tuple(TREND_GUIDELINES)
+TREND_KEY_RE = re.compile('(?=' + '|'.join(f'({re.escape(key)})' for key in TREND_KEYS) + ')')
+
+@lru_cache(maxsize=256)
 def get_questionnaire_key(questionnaire_name: str) -> str:
-    """Extract questionnaire key from full name"""
+    """Extract questionnaire key from full name (memoised; names repeat across runs and callers)"""
     name = questionnaire_name.lower().strip()
     # Handle PROMIS subtypes explicitly first
     if "promis" in name:
@@ -123,33 +161,74 @@ def get_questionnaire_key(questionnaire_name: str) -> str:
         if "anxiety" in name:
             return "promis-anxiety"
         return "promis"
-    # Generic matching for other tools
-    for key in TREND_GUIDELINES.keys():
-        if key in name:
-            return key
-    return "unknown"
+    # Generic matching for other tools; the earliest key in TREND_GUIDELINES order wins
+    group_index = min((match.lastindex for match in TREND_KEY_RE.finditer(name)), default=None)
+    return TREND_KEYS[group_index - 1] if group_index else "unknown"
+
+# Shared defaults for results without a 'derived' dict and items without a 'json'
+# payload (read-only, never copied into the output)
+NO_DERIVED = MappingProxyType({})
+NO_JSON = MappingProxyType({})
+
+def raw_total_score(result: Dict[str, Any]) -> Any:
+    """All other questionnaires use raw_total"""
+    return result.get('raw_total', 0)
+
+def pedsql_score(result: Dict[str, Any]) -> Any:
+    """PedsQL: use transformed total_score (0-100 scale) stored in derived instead of raw sum"""
+    return result.get('derived', NO_DERIVED).get('total_score', result.get('raw_total', 0))
+
+def promis_score(result: Dict[str, Any]) -> Any:
+    """PROMIS: use T-score stored in derived instead of raw sum"""
+    return result.get('derived', NO_DERIVED).get('t_score', result.get('raw_total', 0))
+
+def who5_score(result: Dict[str, Any]) -> Any:
+    """WHO-5: use index score (0-100) instead of raw sum"""
+    return result.get('who5_index', result.get('raw_total', 0) * 4)
+
+# Score extractor per questionnaire key; keys not listed use raw_total_score
+SCORE_EXTRACTORS = {key: promis_score for key in TREND_GUIDELINES if key.startswith("promis")}
+SCORE_EXTRACTORS.update({
+    "pedsql": pedsql_score,
+    "who-5": who5_score
+})
 
 def parse_date(date_str: str) -> Optional[datetime]:
     """Parse date string to datetime object"""
-    if not date_str:
+    if not date_str or not isinstance(date_str, str):
         return None
+    return parse_date_string(date_str)
+
+@lru_cache(maxsize=2048)
+def parse_date_string(date_str: str) -> Optional[datetime]:
+    """Parse a non-empty date string (memoised; the same dates recur across results)"""
     try:
         return datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-    except:
-        try:
-            return datetime.strptime(date_str, '%Y-%m-%d')
-        except:
-            return None
+    except ValueError:
+        pass
+    try:
+        # Non-ISO forms such as unpadded '2024-1-5'
+        return datetime.strptime(date_str, '%Y-%m-%d')
+    except ValueError:
+        return None
 
-def validate_data_for_trends(results: List[Dict]) -> Dict[str, Any]:
+def parse_result_dates(results: List[Dict]) -> Dict[int, Optional[datetime]]:
     """
-    Validate if data is suitable for trend analysis
-    Returns validation info and warnings
+    Parse each result's date once, keyed by id(result)
+    Lets validation, filtering and sorting share one parse per result
+    """
+    return {id(result): parse_date(result.get('date', '')) for result in results}
+
+def summarize_validation(total_items: int, valid_dates: List[datetime],
+                         valid_timepoints: List[Any], unique_timepoints: int) -> Dict[str, Any]:
+    """
+    Build validation info from the dates and timepoints found in a questionnaire's results
+    Decides whether trends can be analyzed and which sort method to use
     """
     validation = {
-        "total_items": len(results),
-        "items_with_dates": 0,
-        "items_with_timepoints": 0,
+        "total_items": total_items,
+        "items_with_dates": len(valid_dates),
+        "items_with_timepoints": len(valid_timepoints),
         "date_range": None,
         "timepoint_range": None,
         "warnings": [],
@@ -157,38 +236,23 @@ def validate_data_for_trends(results: List[Dict]) -> Dict[str, Any]:
         "sort_method": None
     }
     
-    valid_dates = []
-    valid_timepoints = []
-    
-    for result in results:
-        # Check dates
-        date_obj = parse_date(result.get('date', ''))
-        if date_obj:
-            validation["items_with_dates"] += 1
-            valid_dates.append(date_obj)
-        
-        # Check timepoints
-        timepoint = result.get('timepoint', 0)
-        if timepoint and timepoint > 0:
-            validation["items_with_timepoints"] += 1
-            valid_timepoints.append(timepoint)
-    
-    # Determine date range
+    # Determine date range (min/max instead of a sort; max scans reversed so ties
+    # resolve to the last equal value, as the last element of a stable sort would)
     if valid_dates:
-        valid_dates.sort()
+        earliest_date = min(valid_dates)
+        latest_date = max(reversed(valid_dates))
         validation["date_range"] = {
-            "earliest": valid_dates[0].strftime('%Y-%m-%d'),
-            "latest": valid_dates[-1].strftime('%Y-%m-%d'),
-            "span_days": (valid_dates[-1] - valid_dates[0]).days
+            "earliest": earliest_date.strftime('%Y-%m-%d'),
+            "latest": latest_date.strftime('%Y-%m-%d'),
+            "span_days": (latest_date - earliest_date).days
         }
     
     # Determine timepoint range
     if valid_timepoints:
-        valid_timepoints.sort()
         validation["timepoint_range"] = {
-            "earliest": valid_timepoints[0],
-            "latest": valid_timepoints[-1],
-            "unique_timepoints": len(set(valid_timepoints))
+            "earliest": min(valid_timepoints),
+            "latest": max(reversed(valid_timepoints)),
+            "unique_timepoints": unique_timepoints
         }
     
     # Determine if we can analyze and how
@@ -208,47 +272,100 @@ def validate_data_for_trends(results: List[Dict]) -> Dict[str, Any]:
     
     return validation
 
-def sort_results_for_trends(results: List[Dict], sort_method: str) -> List[Dict]:
+def validate_data_for_trends(results: List[Dict],
+                             parsed_dates: Optional[Dict[int, Optional[datetime]]] = None) -> Dict[str, Any]:
+    """
+    Validate if data is suitable for trend analysis
+    Returns validation info and warnings
+    """
+    if parsed_dates is None:
+        parsed_dates = parse_result_dates(results)
+    
+    valid_dates = []
+    valid_timepoints = []
+    seen_timepoints = set()
+    
+    for result in results:
+        # Check dates
+        date_obj = parsed_dates[id(result)]
+        if date_obj:
+            valid_dates.append(date_obj)
+        
+        # Check timepoints
+        timepoint = result.get('timepoint', 0)
+        if timepoint and timepoint > 0:
+            valid_timepoints.append(timepoint)
+            seen_timepoints.add(timepoint)
+    
+    return summarize_validation(len(results), valid_dates, valid_timepoints, len(seen_timepoints))
+
+def sort_results_for_trends(results: List[Dict], sort_method: str,
+                            parsed_dates: Optional[Dict[int, Optional[datetime]]] = None) -> List[Dict]:
     """
     Sort results based on available data (dates, timepoints, or both)
     """
+    if sort_method in ("date_primary", "timepoint_only"):
+        if parsed_dates is None:
+            parsed_dates = parse_result_dates(results)
+        points = [(parsed_dates[id(result)], result.get('timepoint', 0), result) for result in results]
+        return sort_trend_points(points, sort_method)
+    else:
+        return results
+
+def sort_trend_points(points: List[Tuple[Optional[datetime], Any, Dict]], sort_method: str) -> List[Dict]:
+    """
+    Filter and sort (date, timepoint, result) points, returning the results in trend order
+    """
     if sort_method == "date_primary":
         # Primary: date, Secondary: timepoint
-        def sort_key(result):
-            date_obj = parse_date(result.get('date', ''))
-            timepoint = result.get('timepoint', 0)
-            # Use a very early date for missing dates, then sort by timepoint
-            if date_obj:
-                return (date_obj, timepoint)
-            else:
-                return (datetime(1900, 1, 1), timepoint)
-        
+        # Use a very early date for missing dates, then sort by timepoint
         # Filter out items without either date or timepoint
-        valid_results = []
-        for result in results:
-            date_obj = parse_date(result.get('date', ''))
-            timepoint = result.get('timepoint', 0)
-            if date_obj or timepoint > 0:
-                valid_results.append(result)
-        
-        return sorted(valid_results, key=sort_key)
-    
-    elif sort_method == "timepoint_only":
+        keyed = [
+            ((date_obj or EARLIEST_DATE, timepoint), result)
+            for date_obj, timepoint, result in points
+            if date_obj or timepoint > 0
+        ]
+    else:
         # Sort by timepoint only
-        valid_results = [r for r in results if r.get('timepoint', 0) > 0]
-        return sorted(valid_results, key=lambda x: x.get('timepoint', 0))
+        keyed = [(timepoint, result) for _, timepoint, result in points if timepoint > 0]
+    keyed.sort(key=itemgetter(0))
+    return [result for _, result in keyed]
+
+def prepare_results(results: List[Dict]) -> Tuple[Dict[str, Any], List[Dict]]:
+    """
+    Validate and sort one questionnaire's results in a single pass over them
+    Returns (validation info, results in trend order); the list is empty when trends can't be analyzed
+    """
+    points = []
+    valid_dates = []
+    valid_timepoints = []
+    seen_timepoints = set()
     
-    else:
-        return results
+    for result in results:
+        date_obj = parse_date(result.get('date', ''))
+        timepoint = result.get('timepoint', 0)
+        points.append((date_obj, timepoint, result))
+        if date_obj:
+            valid_dates.append(date_obj)
+        if timepoint and timepoint > 0:
+            valid_timepoints.append(timepoint)
+            seen_timepoints.add(timepoint)
+    
+    validation = summarize_validation(len(results), valid_dates, valid_timepoints, len(seen_timepoints))
+    if not validation["can_analyze"]:
+        return validation, []
+    return validation, sort_trend_points(points, validation["sort_method"])
 
-def calculate_days_between(date1: str, date2: str) -> int:
-    """Calculate days between two date strings"""
-    d1 = parse_date(date1)
-    d2 = parse_date(date2)
+def days_between(d1: Optional[datetime], d2: Optional[datetime]) -> int:
+    """Calculate days between two parsed dates (0 if either is missing)"""
     if d1 and d2:
         return abs((d2 - d1).days)
     return 0
 
+def calculate_days_between(date1: str, date2: str) -> int:
+    """Calculate days between two date strings"""
+    return days_between(parse_date(date1), parse_date(date2))
+
 def estimate_days_from_timepoints(initial_timepoint: int, latest_timepoint: int) -> int:
     """
     Estimate days between timepoints based on common administration intervals
@@ -322,35 +439,34 @@ def analyze_questionnaire_trends(processed_data: List[Dict]) -> Dict[str, Any]:
     """
     
     # Debug logging for n8n
-    print(f"🔍 TREND ANALYSIS: Starting with {len(processed_data)} processed items")
+    debug = logger.isEnabledFor(logging.DEBUG)
+    if debug:
+        logger.debug("🔍 TREND ANALYSIS: Starting with %d processed items", len(processed_data))
     
     # Group by questionnaire
-    questionnaire_groups = {}
+    questionnaire_groups = defaultdict(list)
     profile_id = "unknown"
-    questionnaire_counts = {}
     
     for item in processed_data:
-        data = item.get('json', {})
+        data = item.get('json', NO_JSON)
         questionnaire = data.get('questionnaire', '')
         
-        # Count for debugging
-        questionnaire_counts[questionnaire] = questionnaire_counts.get(questionnaire, 0) + 1
-        
         # Validate that this looks like aggregated data (should have raw_total)
         if 'raw_total' not in data:
-            print(f"Warning: Item missing 'raw_total' - may not be properly aggregated: {questionnaire}")
+            logger.warning("Item missing 'raw_total' - may not be properly aggregated: %s", questionnaire)
         
-        if questionnaire not in questionnaire_groups:
-            questionnaire_groups[questionnaire] = []
         questionnaire_groups[questionnaire].append(data)
     
-    print(f"🔍 TREND ANALYSIS: Grouped into {len(questionnaire_groups)} questionnaires: {dict(questionnaire_counts)}")
-    
-    # Debug: Show what we received
-    print(f"📊 Received {len(processed_data)} processed items")
-    for q, items in questionnaire_groups.items():
-        timepoints = [item.get('timepoint', '?') for item in items]
-        print(f"   {q}: {len(items)} timepoints {timepoints}")
+    if debug:
+        # Count for debugging (group sizes; no separate counter in the loop)
+        questionnaire_counts = {q: len(results) for q, results in questionnaire_groups.items()}
+        logger.debug("🔍 TREND ANALYSIS: Grouped into %d questionnaires: %s", len(questionnaire_groups), questionnaire_counts)
+        
+        # Debug: Show what we received
+        logger.debug("📊 Received %d processed items", len(processed_data))
+        for q, items in questionnaire_groups.items():
+            timepoints = [item.get('timepoint', '?') for item in items]
+            logger.debug("   %s: %d timepoints %s", q, len(items), timepoints)
     
     # Analyze trends for each questionnaire
     trends = []
@@ -362,83 +478,50 @@ def analyze_questionnaire_trends(processed_data: List[Dict]) -> Dict[str, Any]:
             overall_warnings.append(f"{questionnaire}: Only {len(results)} assessment(s) - need at least 2 for trends")
             continue
         
-        # Validate data quality for this questionnaire
-        validation = validate_data_for_trends(results)
+        # Validate data quality and sort results using the determined method, in one pass
+        validation, sorted_results = prepare_results(results)
         
         if not validation["can_analyze"]:
             overall_warnings.extend([f"{questionnaire}: {w}" for w in validation["warnings"]])
             continue
         
-        # Sort results using the determined method
-        sorted_results = sort_results_for_trends(results, validation["sort_method"])
-        
         if len(sorted_results) < 2:
             overall_warnings.append(f"{questionnaire}: Insufficient valid data after filtering")
             continue
         
         # Get questionnaire guidelines
         q_key = get_questionnaire_key(questionnaire)
-        guidelines = TREND_GUIDELINES.get(q_key, {
-            "name": questionnaire,
-            "frequency": "unknown",
-            "sensitivity": "unknown",
-            "improvement_direction": "decrease"
-        })
+        guidelines = GUIDELINE_RECORDS.get(q_key) or unknown_guidelines(questionnaire)
         
         # Extract timeline data
         initial = sorted_results[0]
         latest = sorted_results[-1]
         
         # Get appropriate score for analysis based on questionnaire type
-        # PedsQL: Use transformed total_score (0-100 scale) instead of raw sum
-    # PROMIS: Use T-score instead of raw sum
-        # WHO-5: Use index score (0-100) instead of raw sum
-        # Others: Use raw_total
-        
-        if q_key == "pedsql":
-            # PedsQL stores transformed scores in derived
-            initial_score = initial.get('derived', {}).get('total_score', initial.get('raw_total', 0))
-            latest_score = latest.get('derived', {}).get('total_score', latest.get('raw_total', 0))
-        elif q_key.startswith("promis"):
-            # PROMIS stores T-scores in derived
-            initial_score = initial.get('derived', {}).get('t_score', initial.get('raw_total', 0))
-            latest_score = latest.get('derived', {}).get('t_score', latest.get('raw_total', 0))
-        elif q_key == "who-5":
-            # WHO-5 uses index score (0-100)
-            initial_score = initial.get('who5_index', initial.get('raw_total', 0) * 4)
-            latest_score = latest.get('who5_index', latest.get('raw_total', 0) * 4)
-        else:
-            # All other questionnaires use raw_total
-            initial_score = initial.get('raw_total', 0)
-            latest_score = latest.get('raw_total', 0)
+        # Scores are extracted once per result and shared by the trend and the history
+        extract_score = SCORE_EXTRACTORS.get(q_key, raw_total_score)
+        scores = [extract_score(result) for result in sorted_results]
+        initial_score = scores[0]
+        latest_score = scores[-1]
         
         # Calculate trend
         trend_analysis = determine_trend_direction(
             initial_score, latest_score,
             initial.get('severity', ''), latest.get('severity', ''),
-            guidelines["improvement_direction"]
+            guidelines.improvement_direction
         )
         
         # Build history
-        history = []
-        for result in sorted_results:
-            # Use same score extraction logic as main analysis
-            if q_key == "pedsql":
-                score = result.get('derived', {}).get('total_score', result.get('raw_total', 0))
-            elif q_key.startswith("promis"):
-                score = result.get('derived', {}).get('t_score', result.get('raw_total', 0))
-            elif q_key == "who-5":
-                score = result.get('who5_index', result.get('raw_total', 0) * 4)
-            else:
-                score = result.get('raw_total', 0)
-                
-            history.append({
+        history = [
+            {
                 "date": result.get('date', ''),
                 "timepoint": result.get('timepoint', 0),
                 "score": score,
                 "severity": result.get('severity', ''),
                 "clinical_flags": result.get('clinical_flags', [])
-            })
+            }
+            for result, score in zip(sorted_results, scores)
+        ]
         
         # Calculate time span based on available data
         initial_date = initial.get('date', '')
@@ -472,11 +555,11 @@ def analyze_questionnaire_trends(processed_data: List[Dict]) -> Dict[str, Any]:
         
         # Build trend summary
         trend_summary = {
-            "questionnaire": guidelines["name"],
+            "questionnaire": guidelines.name,
             "questionnaire_key": q_key,
             "administration_info": {
-                "recommended_frequency": guidelines["frequency"],
-                "sensitivity": guidelines["sensitivity"]
+                "recommended_frequency": guidelines.frequency,
+                "sensitivity": guidelines.sensitivity
             },
             "timeline": timeline_info,
             "data_quality": {
@@ -506,9 +589,10 @@ def analyze_questionnaire_trends(processed_data: List[Dict]) -> Dict[str, Any]:
     
     # Generate overall summary
     total_assessments = sum(len(results) for results in questionnaire_groups.values())
-    improving_trends = sum(1 for t in trends if t["score_analysis"]["trend_direction"] == "improvement")
-    worsening_trends = sum(1 for t in trends if t["score_analysis"]["trend_direction"] == "worsening")
-    stable_trends = sum(1 for t in trends if t["score_analysis"]["trend_direction"] == "stable")
+    direction_counts = Counter(t["score_analysis"]["trend_direction"] for t in trends)
+    improving_trends = direction_counts["improvement"]
+    worsening_trends = direction_counts["worsening"]
+    stable_trends = direction_counts["stable"]
     
     return {
         "profile_summary": {
@@ -545,37 +629,41 @@ def analyze_questionnaire_trends(processed_data: List[Dict]) -> Dict[str, Any]:
 # Check if running in n8n environment
 if 'items' in globals():
     try:
-        # Debug: Log what we received from previous node (preprocessor)
-        print(f"🔍 n8n TREND DEBUG: Received {len(items)} processed items from preprocessor")
+        debug = logger.isEnabledFor(logging.DEBUG)
         
-        if items:
-            sample_item = items[0].get('json', {})
-            print(f"🔍 n8n TREND DEBUG: Sample item keys: {list(sample_item.keys())}")
-            print(f"🔍 n8n TREND DEBUG: Sample questionnaire: {sample_item.get('questionnaire', 'N/A')}")
-            print(f"🔍 n8n TREND DEBUG: Sample timepoint: {sample_item.get('timepoint', 'N/A')}")
+        # Debug: Log what we received from previous node (preprocessor)
+        if debug:
+            logger.debug("🔍 n8n TREND DEBUG: Received %d processed items from preprocessor", len(items))
+            
+            if items:
+                sample_item = items[0].get('json', NO_JSON)
+                logger.debug("🔍 n8n TREND DEBUG: Sample item keys: %s", list(sample_item.keys()))
+                logger.debug("🔍 n8n TREND DEBUG: Sample questionnaire: %s", sample_item.get('questionnaire', 'N/A'))
+                logger.debug("🔍 n8n TREND DEBUG: Sample timepoint: %s", sample_item.get('timepoint', 'N/A'))
         
         # Perform trend analysis
         trend_analysis = analyze_questionnaire_trends(items)
         
-        # Debug: Log results
-        print(f"✅ n8n TREND SUCCESS: Generated trend analysis")
-        print(f"   → Analyzed {trend_analysis['profile_summary']['questionnaires_with_trends']} questionnaires")
-        print(f"   → Improving: {trend_analysis['trend_overview']['improving']}, Worsening: {trend_analysis['trend_overview']['worsening']}, Stable: {trend_analysis['trend_overview']['stable']}")
-        
-        # Log summary of trends
-        for trend in trend_analysis.get('detailed_trends', []):
-            q_name = trend.get('questionnaire', 'Unknown')
-            direction = trend['score_analysis']['trend_direction']
-            change = trend['score_analysis']['change']
-            print(f"   → {q_name}: {direction} (change: {change:+.1f})")
+        # Debug: Log results and a summary of trends
+        if debug:
+            logger.debug("✅ n8n TREND SUCCESS: Generated trend analysis")
+            logger.debug("   → Analyzed %d questionnaires", trend_analysis['profile_summary']['questionnaires_with_trends'])
+            logger.debug("   → Improving: %d, Worsening: %d, Stable: %d",
+                         trend_analysis['trend_overview']['improving'],
+                         trend_analysis['trend_overview']['worsening'],
+                         trend_analysis['trend_overview']['stable'])
+            
+            for trend in trend_analysis.get('detailed_trends', []):
+                q_name = trend.get('questionnaire', 'Unknown')
+                direction = trend['score_analysis']['trend_direction']
+                change = trend['score_analysis']['change']
+                logger.debug("   → %s: %s (change: %+.1f)", q_name, direction, change)
         
         # Return trend analysis to next n8n node
         return [{'json': trend_analysis}]
 
     except Exception as e:
         # Return detailed error information for n8n debugging
-        import traceback
-        
         error_details = {
             'error_message': str(e),
             'error_type': type(e).__name__,
@@ -589,8 +677,7 @@ if 'items' in globals():
             }
         }
         
-        print(f"❌ n8n TREND ERROR: {str(e)}")
-        print(f"🔍 n8n TREND DEBUG: Error details logged in output")
+        logger.error("❌ n8n TREND ERROR: %s (details returned in output)", e)
         
         # Return error as JSON for next node
         return [{'json': error_details}]